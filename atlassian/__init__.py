@@ -1,7 +1,16 @@
+import codecs
+import collections
+import functools
+import itertools
 import json
 import logging
+import threading
 import requests
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import closing
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlencode, urljoin
+from .utils import iter_json_array
 
 # flake8: noqa
 
@@ -10,12 +19,56 @@ log = logging.getLogger("atlassian")
 
 class AtlassianRestAPI:
     """See https://docs.atlassian.com/jira/REST/latest/#api/2/
+
+    Every instance keeps one ``requests.Session`` so connections are reused between calls.
+    ``pool_connections`` is the number of hosts kept in the pool, ``pool_maxsize`` the number of
+    keep-alive connections per host and ``pool_block`` makes callers wait for a free connection
+    instead of opening extra ones. An existing ``session`` may be passed in to share one pool
+    between several clients.
+
+    ``cache`` takes an ``atlassian.cache.MemoryCache`` or ``DiskCache`` used to revalidate GET responses
+    instead of downloading them again. ``rate_limiter`` takes an ``atlassian.ratelimit.RateLimiter``,
+    which may be shared between clients, to pace requests and retry throttled ones.
+    ``transport`` takes an ``atlassian.cassette.Recorder`` to record the responses to a file, or a ``Player`` to
+    answer requests from such a file instead of the server.
     """
-    def __init__(self, url, username, password, verifySSL=False):
+    def __init__(self, url, username, password, verifySSL=False, session=None, timeout=60,
+                 pool_connections=10, pool_maxsize=10, pool_block=False, cache=None, rate_limiter=None,
+                 transport=None):
         self.url = url
         self.username = username
         self.password = password
         self.verifySSL = verifySSL
+        self.timeout = timeout
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.transport = transport
+        self._session_lock = threading.Lock()
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                  pool_block=pool_block)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._own_session = True
+        else:
+            self._own_session = False
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the connection pool. A session passed in by the caller is left open.
+        """
+        with self._session_lock:
+            if self._own_session and self.session is not None:
+                self.session.close()
+            self.session = None
 
     def log_curl_debug(self, method, path, data=None, headers={}, level=logging.DEBUG):
         message = "curl --silent -X {method} -u '{username}':'{password}' -H {headers} {data} '{url}'".format(
@@ -27,11 +80,150 @@ class AtlassianRestAPI:
             url='{0}{1}'.format(self.url, path))
         log.log(level=level, msg=message)
 
+    @staticmethod
+    def imap(func, iterable, workers=1, ordered=True):
+        """
+        Calls ``func`` for every item of ``iterable`` on up to ``workers`` threads and yields the results.
+        Calls are started ahead of the consumer, so the next results are fetched while the current one is processed.
+        Results come in input order, or as soon as they are ready with ``ordered=False``.
+        With ``workers=0`` everything runs in the calling thread. Exceptions raised by ``func`` are re-raised here.
+
+        >>> import time
+        >>> list(AtlassianRestAPI.imap(lambda x: time.sleep(0.01 * (4 - x)) or x, range(4), workers=4))
+        [0, 1, 2, 3]
+        >>> results = list(AtlassianRestAPI.imap(lambda x: time.sleep(0.2 if x == 0 else 0) or x, range(3), workers=3,
+        ...                                      ordered=False))
+        >>> results[-1], sorted(results)
+        (0, [0, 1, 2])
+        >>> list(AtlassianRestAPI.imap(str, range(3), workers=0))
+        ['0', '1', '2']
+
+        No more than ``workers`` items are taken from ``iterable`` ahead of the consumer, one more for every result
+        handed out, and closing the generator stops taking them:
+
+        >>> taken = []
+        >>> def items():
+        ...     for i in range(100):
+        ...         taken.append(i)
+        ...         yield i
+        >>> results = AtlassianRestAPI.imap(lambda x: x * 2, items(), workers=2)
+        >>> next(results), next(results)
+        (0, 2)
+        >>> results.close()
+        >>> taken
+        [0, 1, 2, 3]
+        >>> list(AtlassianRestAPI.imap(lambda x: 1 // x, [1, 0, 2], workers=2))
+        Traceback (most recent call last):
+        ...
+        ZeroDivisionError: integer division or modulo by zero
+        """
+        if not workers:
+            for item in iterable:
+                yield func(item)
+            return
+
+        items = iter(iterable)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = collections.deque(executor.submit(func, item) for item in itertools.islice(items, workers))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done = wait(pending, return_when=FIRST_COMPLETED).done
+                    pending = collections.deque(future for future in pending if future not in done)
+                results = [future.result() for future in done]
+                pending.extend(executor.submit(func, item) for item in itertools.islice(items, len(done)))
+                for result in results:
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def memoize(func, key=None):
+        """
+        Wraps ``func`` so that it runs once per distinct set of positional arguments, or per ``key(*args)`` when given,
+        also when several threads ask for the same arguments at the same time. Failed calls are not remembered.
+        The results live as long as the wrapper; ``wrapper.forget(*args)`` drops one and ``wrapper.clear()`` all.
+
+        >>> import time
+        >>> calls = []
+        >>> def double(x):
+        ...     calls.append(x)
+        ...     time.sleep(0.05)
+        ...     return x * 2
+        >>> double = AtlassianRestAPI.memoize(double)
+        >>> list(AtlassianRestAPI.imap(double, [1, 1, 1, 2], workers=4))
+        [2, 2, 2, 4]
+        >>> sorted(calls)
+        [1, 2]
+        >>> attempts = []
+        >>> def flaky(x):
+        ...     attempts.append(x)
+        ...     if len(attempts) == 1:
+        ...         raise ValueError('unavailable')
+        ...     return x
+        >>> flaky = AtlassianRestAPI.memoize(flaky)
+        >>> flaky(1)
+        Traceback (most recent call last):
+        ...
+        ValueError: unavailable
+        >>> flaky(1), flaky(1), len(attempts)
+        (1, 1, 2)
+        >>> calls = []
+        >>> upper = AtlassianRestAPI.memoize(lambda name: calls.append(name) or name.upper(), key=str.lower)
+        >>> upper('a'), upper('A'), calls
+        ('A', 'A', ['a'])
+        >>> upper.forget('A')
+        >>> upper('A'), calls
+        ('A', ['a', 'A'])
+        >>> upper.clear()
+        >>> upper('a'), calls
+        ('A', ['a', 'A', 'a'])
+        """
+        futures = {}
+        lock = threading.Lock()
+
+        def wrapper(*args):
+            cache_key = args if key is None else key(*args)
+            with lock:
+                future = futures.get(cache_key)
+                owner = future is None
+                if owner:
+                    future = futures[cache_key] = Future()
+            if owner:
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    with lock:
+                        if futures.get(cache_key) is future:
+                            del futures[cache_key]
+                    future.set_exception(e)
+            return future.result()
+
+        def forget(*args):
+            with lock:
+                futures.pop(args if key is None else key(*args), None)
+
+        def clear():
+            with lock:
+                futures.clear()
+
+        wrapper.forget = forget
+        wrapper.clear = clear
+        return wrapper
+
     def resource_url(self, resource, version='latest'):
         return '/'.join(['rest', 'api', version, resource])
 
     def request(self, method='GET', path='/', data=None, flags=None, params=None,
-                headers={'Content-Type': 'application/json', 'Accept': 'application/json'}):
+                headers={'Content-Type': 'application/json', 'Accept': 'application/json'}, stream=False):
+        """
+        With ``stream`` the body of a successful response is not read, so it can be consumed with
+        ``response.iter_content()``; close the response when done.
+        """
         self.log_curl_debug(method=method, path=path, headers=headers, data=data)
         url = urljoin(self.url, path)
         if params or flags:
@@ -41,15 +233,59 @@ class AtlassianRestAPI:
         if flags:
             url += ('&' if params else '') + '&'.join(flags or [])
 
-        response = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
-            data=json.dumps(data),
-            auth=(self.username, self.password),
-            timeout=60,
-            verify=self.verifySSL)
-        if response.status_code == 200:
+        session = self.session
+        if session is None:
+            raise RuntimeError('{0} is closed'.format(self.__class__.__name__))
+
+        if self.transport is None:
+            transport = session.request
+        else:
+            transport = functools.partial(self.transport.send, session)
+
+        def send(headers):
+            return self._send(transport, method, url, headers, data, stream)
+
+        if self.cache is not None and method == 'GET' and not stream:
+            response = self.cache.fetch(self.cache.key(url, self.username), headers, send)
+        else:
+            response = send(headers)
+        self._check_response(response, method, path, headers, data, stream)
+        return response
+
+    def _send(self, transport, method, url, headers, data, stream):
+        """
+        Sends one request with ``transport``, pacing it and retrying it as the rate limiter says.
+        """
+        limiter = self.rate_limiter
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+            response = transport(
+                method=method,
+                url=url,
+                headers=headers,
+                data=json.dumps(data),
+                auth=(self.username, self.password),
+                timeout=self.timeout,
+                verify=self.verifySSL,
+                stream=stream)
+            if limiter is None:
+                return response
+            limiter.update(response)
+            if not limiter.retry(method, response, attempt):
+                return response
+            # release the connection of the throttled response, it is not read when streaming
+            response.close()
+            attempt += 1
+
+    def _check_response(self, response, method, path, headers, data, stream):
+        """
+        Logs ``response`` and raises ``HTTPError`` for an error status.
+        """
+        if stream and response.ok:
+            log.debug('Received "{0}" response, streaming the body'.format(response.status_code))
+        elif response.status_code == 200:
             log.debug('Received: {0}'.format(response.json()))
         elif response.status_code == 204:
             log.debug('Received "204 No Content" response')
@@ -60,13 +296,28 @@ class AtlassianRestAPI:
                 log.info(response.json())
             except Exception:
                 pass
+            if stream:
+                # the caller never gets this response to close, so release its connection now
+                response.close()
             response.raise_for_status()
-        return response
 
     def get(self, path, data=None, flags=None, params=None,
             headers={'Content-Type': 'application/json', 'Accept': 'application/json'}):
         return self.request('GET', path=path, flags=flags, params=params, data=data, headers=headers).json()
 
+    def get_json_items(self, path, key, flags=None, params=None, chunk_size=64 * 1024,
+                       headers={'Content-Type': 'application/json', 'Accept': 'application/json'}):
+        """
+        Yields the items of the top-level array ``key`` of a JSON response while the body is still being received,
+        instead of decoding the whole body at once like ``get``.
+        """
+        with closing(self.request('GET', path=path, flags=flags, params=params, headers=headers,
+                                  stream=True)) as response:
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+            chunks = (decoder.decode(chunk) for chunk in response.iter_content(chunk_size))
+            for item in iter_json_array(chunks, key):
+                yield item
+
     def post(self, path, data=None, headers={'Content-Type': 'application/json', 'Accept': 'application/json'}):
         try:
             return self.request('POST', path=path, data=data, headers=headers).json()
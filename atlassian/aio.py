@@ -0,0 +1,129 @@
+import asyncio
+import functools
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from atlassian import AtlassianRestAPI
+from atlassian.bamboo import Bamboo
+from atlassian.confluence import Confluence
+from atlassian.jira import Jira
+from atlassian.stash import Stash
+
+
+log = logging.getLogger('atlassian.aio')
+
+__all__ = ['AsyncAtlassianRestAPI', 'AsyncJira', 'AsyncConfluence', 'AsyncStash', 'AsyncBamboo']
+
+_exhausted = object()
+
+
+class AsyncAtlassianRestAPI:
+    """Asyncio client built on top of the blocking ``client_class``.
+
+    Every public method of the wrapped client is available as a coroutine and generator methods
+    (e.g. ``Jira.project_leaders``) as async generators. A semaphore runs at most ``concurrency``
+    calls at once on a pool of as many worker threads. Methods that fan out on their own threads get
+    at most ``concurrency`` ``workers``, and all requests share one blocking connection pool of
+    ``concurrency`` connections, so at most ``concurrency`` requests are in flight and callers can
+    ``asyncio.gather`` hundreds of calls safely:
+
+        async with AsyncJira(url, username, password, concurrency=50) as jira:
+            projects = await asyncio.gather(*[jira.project(key) for key in keys])
+            async for leader in jira.project_leaders():
+                ...
+    """
+    client_class = AtlassianRestAPI
+
+    def __init__(self, *args, concurrency=10, **kwargs):
+        kwargs.setdefault('pool_maxsize', concurrency)
+        kwargs.setdefault('pool_block', True)
+        self.client = self.client_class(*args, **kwargs)
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        # created lazily so that it belongs to the loop which runs the requests
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs the blocking ``func`` on the worker pool, waiting for a free slot first.
+        """
+        async with self.semaphore:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        if inspect.isgenerator(result):
+            return self.iterate(result)
+        return result
+
+    async def iterate(self, iterator):
+        """
+        Turns a blocking iterator into an async generator. Each item is fetched on the worker pool.
+        """
+        while True:
+            item = await self.run(next, iterator, _exhausted)
+            if item is _exhausted:
+                break
+            yield item
+
+    def __getattr__(self, name):
+        if name == 'client' or name.startswith('_'):
+            raise AttributeError(name)
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        if inspect.isgeneratorfunction(attr):
+            @functools.wraps(attr)
+            def agen(*args, **kwargs):
+                return self.iterate(attr(*args, **self.limit_workers(attr, kwargs)))
+            return agen
+
+        @functools.wraps(attr)
+        def coroutine(*args, **kwargs):
+            return self.run(attr, *args, **self.limit_workers(attr, kwargs))
+        return coroutine
+
+    def limit_workers(self, func, kwargs):
+        """
+        Caps the ``workers`` keyword argument of ``func``, or its default, at ``concurrency``.
+        """
+        try:
+            parameter = inspect.signature(func).parameters.get('workers')
+        except (TypeError, ValueError):
+            parameter = None
+        if parameter is None:
+            return kwargs
+        workers = kwargs.get('workers', parameter.default)
+        if isinstance(workers, int) and workers > self.concurrency:
+            kwargs = dict(kwargs, workers=self.concurrency)
+        return kwargs
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncJira(AsyncAtlassianRestAPI):
+    client_class = Jira
+
+
+class AsyncConfluence(AsyncAtlassianRestAPI):
+    client_class = Confluence
+
+
+class AsyncStash(AsyncAtlassianRestAPI):
+    client_class = Stash
+
+
+class AsyncBamboo(AsyncAtlassianRestAPI):
+    client_class = Bamboo
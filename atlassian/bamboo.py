@@ -6,7 +6,8 @@ log = logging.getLogger('atlassian.stash')
 
 class Bamboo(AtlassianRestAPI):
 
-    def base_list_call(self, resource, expand, favourite, cloverEnabled, start_index, max_results, **kwargs):
+    def base_list_call(self, resource, expand, favourite, cloverEnabled, start_index, max_results,
+                       iterator=False, workers=4, **kwargs):
         flags = []
         params = {'start-index': start_index, 'max-results': max_results}
         if expand:
@@ -16,16 +17,55 @@ class Bamboo(AtlassianRestAPI):
         if cloverEnabled:
             flags.append('cloverEnabled')
         params.update(kwargs)
+        if iterator:
+            return self.iter_list_call(self.resource_url(resource), flags, params, workers)
         return self.get(self.resource_url(resource), flags=flags, params=params)
 
-    def projects(self, expand=None, favourite=False, cloverEnabled=False, start_index=0, max_results=25):
-        return self.base_list_call('project', expand, favourite, cloverEnabled, start_index, max_results)
-
-    def plans(self, expand=None, favourite=False, cloverEnabled=False, start_index=0, max_results=25):
-        return self.base_list_call("plan", expand, favourite, cloverEnabled, start_index, max_results)
+    def iter_list_call(self, url, flags, params, workers=4):
+        """
+        Yields every element of a list resource starting at ``start-index``. The ``size``/``max-result`` envelope of
+        the first window tells how many windows remain; those are fetched on up to ``workers`` threads and yielded
+        in order.
+        """
+        def window(start):
+            return self.list_envelope(self.get(url, flags=flags, params=dict(params, **{'start-index': start})))
+
+        start = params['start-index']
+        envelope, elements = window(start)
+        for element in elements:
+            yield element
+
+        step = envelope.get('max-result') or len(elements)
+        if not step:
+            return
+        for envelope, elements in self.imap(window, range(start + step, envelope['size'], step), workers=workers):
+            for element in elements:
+                yield element
+
+    @staticmethod
+    def list_envelope(response):
+        """
+        Splits a list response such as ``{'plans': {'size': 2, 'max-result': 2, 'plan': [...]}}``
+        into the envelope and its list of elements.
+        """
+        for value in response.values():
+            if isinstance(value, dict) and 'size' in value:
+                elements = [element for element in value.values() if isinstance(element, list)]
+                return value, elements[0] if elements else []
+        raise ValueError('Response is not a list: {0}'.format(list(response)))
+
+    def projects(self, expand=None, favourite=False, cloverEnabled=False, start_index=0, max_results=25,
+                 iterator=False):
+        return self.base_list_call('project', expand, favourite, cloverEnabled, start_index, max_results,
+                                   iterator=iterator)
+
+    def plans(self, expand=None, favourite=False, cloverEnabled=False, start_index=0, max_results=25,
+              iterator=False):
+        return self.base_list_call("plan", expand, favourite, cloverEnabled, start_index, max_results,
+                                   iterator=iterator)
 
     def results(self, project_key=None, plan_key=None, build_number=None, expand=None, favourite=False,
-                cloverEnabled=False, label=None, issueKey=None, start_index=0, max_results=25):
+                cloverEnabled=False, label=None, issueKey=None, start_index=0, max_results=25, iterator=False):
         resource = "result"
         if project_key and plan_key and build_number:
             resource += "/{}-{}/{}".format(project_key, plan_key, build_number)
@@ -37,7 +77,8 @@ class Bamboo(AtlassianRestAPI):
         params = {}
         if issueKey:
             params['issueKey'] = issueKey
-        return self.base_list_call(resource, expand, favourite, cloverEnabled, start_index, max_results, **params)
+        return self.base_list_call(resource, expand, favourite, cloverEnabled, start_index, max_results,
+                                   iterator=iterator, **params)
 
     def latest_results(self, expand=None, favourite=False, cloverEnabled=False, label=None, issueKey=None,
                        start_index=0, max_results=25):
@@ -59,12 +100,9 @@ class Bamboo(AtlassianRestAPI):
         return self.results(project_key, plan_key, expand=expand, favourite=favourite, cloverEnabled=cloverEnabled,
                             label=label, issueKey=issueKey, start_index=start_index, max_results=max_results)
 
-    def reports(self, expand=None, start_index=0, max_results=25):
-        params = {'start-index': start_index, 'max-results': max_results}
-        if expand:
-            params['expand'] = expand
-
-        return self.get(self.resource_url('chart/reports'), params=params)
+    def reports(self, expand=None, start_index=0, max_results=25, iterator=False):
+        return self.base_list_call('chart/reports', expand, False, False, start_index, max_results,
+                                   iterator=iterator)
 
     def chart(self, reportKey, buildKeys, groupByPeriod, dateFilter=None, dateFrom=None, dateTo=None,
               width=None, height=None, start_index=9, max_results=25):
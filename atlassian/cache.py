@@ -0,0 +1,212 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+log = logging.getLogger('atlassian.cache')
+
+CacheEntry = collections.namedtuple('CacheEntry', ['etag', 'last_modified', 'headers', 'body'])
+
+# session and user headers, never stored with a cached response
+PRIVATE_HEADERS = {'set-cookie', 'www-authenticate', 'authorization', 'cookie', 'x-ausername', 'x-asessionid'}
+
+
+class ResponseCache:
+    """Base class of the GET response caches passed as ``AtlassianRestAPI(cache=...)``.
+
+    Responses carrying an ``ETag`` or ``Last-Modified`` header are stored and revalidated with
+    ``If-None-Match``/``If-Modified-Since``; a ``304 Not Modified`` answer is served from the cache.
+    ``hits`` counts revalidated responses and ``misses`` responses downloaded in full.
+    Entries above ``max_size`` bytes in total are evicted, least recently used first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, username):
+        return hashlib.sha256('{0} {1}'.format(username, url).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def fetch(self, key, headers, send):
+        """
+        Sends a GET with ``send(headers)``, adding the validators of the cached entry, and stores the response.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            headers = dict(headers)
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        response = send(headers)
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.hits += 1
+            log.debug('Not modified, using cached response for {0}'.format(response.url))
+            return self.response(entry, response)
+
+        with self._lock:
+            self.misses += 1
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 200 and (etag or last_modified):
+            headers = {name: value for name, value in response.headers.items()
+                       if name.lower() not in PRIVATE_HEADERS}
+            self.set(key, CacheEntry(etag, last_modified, headers, response.content))
+        return response
+
+    @staticmethod
+    def response(entry, not_modified):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response._content = entry.body
+        return response
+
+
+class MemoryCache(ResponseCache):
+    """Keeps cached responses in memory.
+
+    >>> cache = MemoryCache(max_size=10)
+    >>> cache.set('a', CacheEntry('"a"', None, {}, b'aaaa'))
+    >>> cache.set('b', CacheEntry('"b"', None, {}, b'bbbb'))
+    >>> cache.get('a').etag
+    '"a"'
+    >>> cache.set('c', CacheEntry('"c"', None, {}, b'cccc'))
+    >>> cache.get('b') is None, sorted(cache._entries), cache.size
+    (True, ['a', 'c'], 8)
+    >>> cache.set('d', CacheEntry('"d"', None, {}, b'd' * 11))
+    >>> cache.get('d') is None, cache.size
+    (True, 8)
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024):
+        super(MemoryCache, self).__init__(max_size)
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            if len(entry.body) > self.max_size:
+                return
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_size:
+                _, old = self._entries.popitem(last=False)
+                self.size -= len(old.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return dict(super(MemoryCache, self).stats(), size=self.size, entries=len(self._entries))
+
+
+class DiskCache(ResponseCache):
+    """Keeps cached responses as files in ``directory``, so they survive between runs.
+
+    Each file holds a line of JSON metadata followed by the body.
+    """
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024):
+        super(DiskCache, self).__init__(max_size)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith('.cache'):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-len('.cache')], stat.st_size))
+        self._sizes = collections.OrderedDict((key, size) for _, key, size in sorted(files))
+        self.size = sum(self._sizes.values())
+
+    def path(self, key):
+        return os.path.join(self.directory, '{0}.cache'.format(key))
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            try:
+                with open(self.path(key), 'rb') as f:
+                    meta = json.loads(f.readline().decode('utf-8'))
+                    body = f.read()
+                os.utime(self.path(key))
+            except (OSError, ValueError) as e:
+                log.warning('Dropping unreadable cache entry {0}: {1}'.format(key, e))
+                self._remove(key)
+                return None
+            self._sizes.move_to_end(key)
+            return CacheEntry(meta['etag'], meta['last_modified'], meta['headers'], body)
+
+    def set(self, key, entry):
+        meta = {'etag': entry.etag, 'last_modified': entry.last_modified, 'headers': entry.headers}
+        data = json.dumps(meta).encode('utf-8') + b'\n' + entry.body
+        with self._lock:
+            self._remove(key)
+            if len(data) > self.max_size:
+                return
+            temp = '{0}.tmp'.format(self.path(key))
+            with open(temp, 'wb') as f:
+                f.write(data)
+            os.replace(temp, self.path(key))
+            self._sizes[key] = len(data)
+            self.size += len(data)
+            while self.size > self.max_size:
+                self._remove(next(iter(self._sizes)))
+
+    def _remove(self, key):
+        size = self._sizes.pop(key, None)
+        if size is None:
+            return
+        self.size -= size
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._sizes):
+                self._remove(key)
+
+    def stats(self):
+        return dict(super(DiskCache, self).stats(), size=self.size, entries=len(self._sizes))
@@ -0,0 +1,169 @@
+import base64
+import collections
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import logging
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib.parse import parse_qsl, urlsplit
+from .cache import PRIVATE_HEADERS
+
+
+log = logging.getLogger('atlassian.cassette')
+
+# never written to a cassette
+SCRUBBED_PARAMS = {'os_username', 'os_password', 'password', 'token', 'access_token', 'jwt'}
+# bodies are recorded decoded, so their transfer headers no longer apply
+TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+# recorded in place of the server's scheme and host, and replaced by those of the replaying client
+ORIGIN = 'http://recorded.invalid'
+
+
+def request_key(method, url, data=None):
+    """
+    Returns what a recorded request is matched by: the method, the path and the query parameters in sorted order,
+    without the host and without credentials passed as parameters. A request with a JSON body ``data`` also gets
+    the digest of its canonical form, so e.g. searches POSTed to the same path are told apart.
+
+    >>> request_key('get', 'https://jira.example.com/rest/api/2/search?maxResults=50&jql=a&os_password=x', 'null')
+    ['GET', '/rest/api/2/search', [['jql', 'a'], ['maxResults', '50']]]
+    >>> key = request_key('POST', 'https://jira.example.com/rest/api/2/search', '{"jql": "a", "startAt": 0}')
+    >>> key == request_key('POST', 'https://jira.example.com/rest/api/2/search', '{"startAt":0,"jql":"a"}')
+    True
+    >>> key == request_key('POST', 'https://jira.example.com/rest/api/2/search', '{"jql": "b", "startAt": 0}')
+    False
+    """
+    parts = urlsplit(url)
+    query = sorted([name, value] for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name.lower() not in SCRUBBED_PARAMS)
+    key = [method.upper(), parts.path, query]
+    if isinstance(data, bytes):
+        data = data.decode('utf-8', 'replace')
+    if data is not None:
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+        else:
+            data = None if data is None else json.dumps(data, sort_keys=True, separators=(',', ':'))
+    if data is not None:
+        key.append(hashlib.sha256(data.encode('utf-8')).hexdigest())
+    return key
+
+
+def origin(url):
+    """
+    >>> origin('https://jira.example.com:8443/rest/api/2/search?jql=a')
+    'https://jira.example.com:8443'
+    """
+    parts = urlsplit(url)
+    return '{0}://{1}'.format(parts.scheme, parts.netloc)
+
+
+class Recorder:
+    """Transport, passed as ``AtlassianRestAPI(transport=...)``, that sends requests over the client's session and
+    writes every request/response pair to the cassette at ``path``, a gzipped file with one JSON exchange per line.
+
+    Only the method, path, query and a digest of the body of requests are recorded, and no cookies, session or user
+    headers of responses, so a cassette holds no credentials. The server's scheme and host are replaced in the headers
+    and text bodies of responses, such as absolute ``self`` links and ``Location``, so they point to the replaying
+    client's server.
+    Streamed responses are read in full to be recorded.
+    Close the recorder, or use it as a context manager, to finish the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                log.info('Recorded {0} responses to {1}'.format(self.count, self.path))
+
+    def send(self, session, method, url, **kwargs):
+        response = session.request(method=method, url=url, **kwargs)
+        body = response.content
+        server = origin(url)
+        try:
+            text, encoding = body.decode('utf-8').replace(server, ORIGIN), None
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(body).decode('ascii'), 'base64'
+        exchange = {
+            'request': request_key(method, url, kwargs.get('data')),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {name: value.replace(server, ORIGIN) for name, value in response.headers.items()
+                        if name.lower() not in PRIVATE_HEADERS | TRANSFER_HEADERS},
+            'body': text,
+        }
+        if encoding:
+            exchange['encoding'] = encoding
+        line = json.dumps(exchange, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self.count += 1
+        return response
+
+
+class Player:
+    """Transport, passed as ``AtlassianRestAPI(transport=...)``, that answers requests from a cassette written by
+    ``Recorder`` without touching the network.
+
+    Requests are matched by method, path, query and body, whatever the host. Responses recorded for the same request
+    are replayed in the order they were recorded, and the last of them is repeated after that.
+    A request that was not recorded raises ``LookupError``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._exchanges = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                exchange = json.loads(line)
+                self._exchanges[json.dumps(exchange['request'])].append(exchange)
+
+    def send(self, session, method, url, **kwargs):
+        key = request_key(method, url, kwargs.get('data'))
+        with self._lock:
+            exchanges = self._exchanges.get(json.dumps(key))
+            if not exchanges:
+                raise LookupError('No response recorded in {0} for {1} {2}'.format(self.path, method, url))
+            exchange = exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+        return self.response(exchange, method, url)
+
+    @staticmethod
+    def response(exchange, method, url):
+        server = origin(url)
+        body = exchange['body']
+        if exchange.get('encoding') == 'base64':
+            body = base64.b64decode(body)
+        else:
+            body = body.replace(ORIGIN, server).encode('utf-8')
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange['reason']
+        response.headers = CaseInsensitiveDict({name: value.replace(ORIGIN, server)
+                                                for name, value in exchange['headers'].items()})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+        response.request = requests.Request(method, url).prepare()
+        response.elapsed = datetime.timedelta(0)
+        # served through raw, so that streamed responses can be consumed with iter_content
+        response.raw = io.BytesIO(body)
+        return response
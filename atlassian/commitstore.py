@@ -0,0 +1,105 @@
+import json
+import logging
+import sqlite3
+import threading
+
+
+log = logging.getLogger('atlassian.commitstore')
+
+
+class CommitStore:
+    """Local SQLite copy of Bitbucket Server commit graphs, filled by ``Stash.sync_commits``.
+
+    Commits never change, so each one is stored once by hash together with its parents.
+    The store also remembers the tip each ref had when it was last synced, so later syncs only
+    download newer commits, and ranges of commits are answered from the local graph.
+    Every stored commit has all of its ancestors stored as well.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS commits (
+                    id TEXT PRIMARY KEY,
+                    timestamp INTEGER,
+                    data TEXT);
+                CREATE TABLE IF NOT EXISTS parents (
+                    child TEXT,
+                    parent TEXT,
+                    PRIMARY KEY (child, parent));
+                CREATE TABLE IF NOT EXISTS refs (
+                    project TEXT,
+                    repository TEXT,
+                    ref TEXT,
+                    tip TEXT,
+                    PRIMARY KEY (project, repository, ref));''')
+
+    def close(self):
+        self.connection.close()
+
+    def add_commits(self, commits):
+        """
+        Stores ``commits`` in a single transaction, so an interrupted sync leaves no partial history behind.
+        :return: number of commits read
+        """
+        count = 0
+        with self._lock, self.connection:
+            for commit in commits:
+                self.connection.execute('INSERT OR IGNORE INTO commits VALUES (?, ?, ?)', (
+                    commit['id'], commit.get('committerTimestamp', commit.get('authorTimestamp')), json.dumps(commit)))
+                self.connection.executemany('INSERT OR IGNORE INTO parents VALUES (?, ?)',
+                                            [(commit['id'], parent['id']) for parent in commit.get('parents', [])])
+                count += 1
+        return count
+
+    def has_commit(self, commit_id):
+        with self._lock:
+            row = self.connection.execute('SELECT 1 FROM commits WHERE id = ?', (commit_id,)).fetchone()
+        return row is not None
+
+    def get_tip(self, project, repository, ref):
+        with self._lock:
+            row = self.connection.execute('SELECT tip FROM refs WHERE project = ? AND repository = ? AND ref = ?',
+                                          (project, repository, ref)).fetchone()
+        return row[0] if row else None
+
+    def set_tip(self, project, repository, ref, tip):
+        with self._lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?)', (project, repository, ref, tip))
+
+    def log(self, tip, exclude=None):
+        """
+        Returns the commits reachable from ``tip`` but not from ``exclude`` (like ``git log exclude..tip``),
+        newest first. Without ``exclude`` all ancestors of ``tip`` are returned.
+
+        >>> store = CommitStore()
+        >>> store.add_commits([{'id': 'b', 'committerTimestamp': 2, 'parents': [{'id': 'a'}]},
+        ...                    {'id': 'a', 'committerTimestamp': 1, 'parents': []}])
+        2
+        >>> [commit['id'] for commit in store.log('b')]
+        ['b', 'a']
+        >>> [commit['id'] for commit in store.log('b', exclude='a')]
+        ['b']
+        """
+        # an empty seed when nothing is excluded, since NOT IN a set holding NULL matches no row
+        query = '''
+            WITH RECURSIVE
+                excluded(id) AS (
+                    {seed}
+                    UNION
+                    SELECT parents.parent FROM parents JOIN excluded ON parents.child = excluded.id),
+                included(id) AS (
+                    SELECT ?
+                    UNION
+                    SELECT parents.parent FROM parents JOIN included ON parents.child = included.id
+                    WHERE parents.parent NOT IN (SELECT id FROM excluded))
+            SELECT data FROM commits
+            WHERE id IN (SELECT id FROM included) AND id NOT IN (SELECT id FROM excluded)
+            ORDER BY timestamp DESC'''.format(seed='SELECT id FROM commits WHERE 0' if exclude is None else 'SELECT ?')
+        params = (tip,) if exclude is None else (exclude, tip)
+        with self._lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [json.loads(data) for data, in rows]
@@ -1,5 +1,10 @@
+import gzip
+import hashlib
+import itertools
 import json
 import logging
+import os
+import threading
 import urllib.parse
 from requests.exceptions import HTTPError
 from atlassian import AtlassianRestAPI
@@ -8,6 +13,23 @@ from atlassian import AtlassianRestAPI
 log = logging.getLogger('atlassian.confluence')
 
 
+class LockedHashStore:
+    """Wraps the ``hash_store`` of ``update_page`` so that several threads can share it. Mappings such as
+    ``shelve`` are not safe for concurrent use."""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.store.get(key, default)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self.store[key] = value
+
+
 class Confluence(AtlassianRestAPI):
 
     # this could return many results; use with care!
@@ -32,14 +54,44 @@ class Confluence(AtlassianRestAPI):
                 break
         return results
 
-    def search1(self, cql, expand=None, start=None, limit=None, details=None):
+    def search_iter(self, cql, expand=None, limit=None, workers=4):
+        """
+        Yields search results page by page instead of collecting them in a list.
+        The first page tells how many results the server returns per page; the following pages are then
+        requested on up to ``workers`` threads at once (a few requests past the last page may be wasted).
+        Unlike ``search``, errors are raised and not just logged.
+        """
+        page_size = 9999 if limit is None else min(limit, 9999)
+        first = self.search_page(cql, expand=expand, start=0, limit=page_size)
+        for item in first['results']:
+            yield item
+        if 'next' not in first['_links'] or not first['results']:
+            return
+
+        step = first['limit']
+        starts = itertools.count(step, step) if limit is None else range(step, limit, step)
+
+        def page(start):
+            return self.search_page(cql, expand=expand, start=start,
+                                    limit=step if limit is None else min(step, limit - start))
+
+        for items in self.imap(page, starts, workers=workers):
+            for item in items['results']:
+                yield item
+            if 'next' not in items['_links'] or not items['results']:
+                break
+
+    def search_page(self, cql, expand=None, start=None, limit=None):
         expand = expand + ',' if expand else ''
         cql = urllib.parse.quote(cql)
         url = '/rest/api/content/search?cql={cql}&expand={expand}'.format(cql=cql, expand=expand)
         if start is not None: url += '&start={start}'.format(start=start)
         if limit is not None: url += '&limit={limit}'.format(limit=limit)
+        return self.get(url)
+
+    def search1(self, cql, expand=None, start=None, limit=None, details=None):
         try:
-            items = self.get(url)
+            items = self.search_page(cql, expand=expand, start=start, limit=limit)
         except Exception as e:
             log.error('Exception: %s' % e)
             items = None
@@ -69,6 +121,89 @@ class Confluence(AtlassianRestAPI):
                               limit=limit)
         return self.get(url)
 
+    def get_space_content_page(self, space, type='page', start=0, limit=100, expand=None):
+        expand = expand + ',' if expand else ''
+        url = '/rest/api/content?spaceKey={space}&type={type}&start={start}&limit={limit}&' \
+              'expand={expand}'.format(space=space, type=type, start=start, limit=limit, expand=expand)
+        return self.get(url)
+
+    def get_space_content_iter(self, space, type='page', expand=None, limit=100):
+        """
+        Yields all content of ``type`` in ``space`` page by page, without bodies unless asked for in ``expand``.
+        """
+        start = 0
+        while True:
+            data = self.get_space_content_page(space, type=type, start=start, limit=limit, expand=expand)
+            for content in data['results']:
+                yield content
+            if 'next' not in data['_links'] or not data['results']:
+                return
+            start += data['size']
+
+    def get_attachments_iter(self, page_id, limit=100):
+        start = 0
+        while True:
+            url = '/rest/api/content/{page_id}/child/attachment?start={start}&limit={limit}'.format(
+                page_id=page_id, start=start, limit=limit)
+            data = self.get(url)
+            for attachment in data['results']:
+                yield attachment
+            if 'next' not in data['_links'] or not data['results']:
+                return
+            start += data['size']
+
+    def export_space(self, space, path, type='page', checkpoint=None, compress=None, workers=8, limit=100):
+        """
+        Writes all ``type`` content of ``space``, with storage body, version, ancestors and attachment metadata,
+        to ``path`` as JSON lines. The space is listed ``limit`` items at a time and the details of each batch are
+        fetched on ``workers`` threads, so memory use doesn't grow with the space.
+        :param checkpoint: file recording how far the export got after every batch; an interrupted export
+                           started again with the same file resumes from there, provided ``path`` still holds at
+                           least what was checkpointed
+        :param compress: gzip the output, by default when ``path`` ends with ``.gz``
+        :return: number of records written by this call
+        """
+        if compress is None:
+            compress = path.endswith('.gz')
+        state = {'start': 0, 'offset': 0}
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            size = os.path.getsize(path) if os.path.exists(path) else None
+            if state['offset'] and (size is None or size < state['offset']):
+                raise ValueError('Cannot resume export to {path} from {checkpoint}: the checkpoint is at byte {offset} '
+                                 'but the file {size}'.format(path=path, checkpoint=checkpoint, offset=state['offset'],
+                                                              size='is missing' if size is None else
+                                                              'has only {0} bytes'.format(size)))
+            log.info('Resuming export of "{space}" at {start}'.format(space=space, start=state['start']))
+
+        def fetch(content):
+            page = self.get_page_by_id(content['id'], expand='version,ancestors')
+            page['attachments'] = list(self.get_attachments_iter(content['id']))
+            return page
+
+        count = 0
+        with open(path, 'r+b' if state['offset'] else 'wb') as out:
+            # drop whatever was written after the last checkpoint
+            out.truncate(state['offset'])
+            out.seek(state['offset'])
+            while True:
+                data = self.get_space_content_page(space, type=type, start=state['start'], limit=limit)
+                lines = ''.join(json.dumps(page) + '\n' for page in self.imap(fetch, data['results'], workers=workers))
+                lines = lines.encode('utf-8')
+                # each batch is a complete gzip member, so the file can be cut at any checkpoint
+                out.write(gzip.compress(lines) if compress else lines)
+                out.flush()
+                count += len(data['results'])
+                state = {'start': state['start'] + data['size'], 'offset': out.tell()}
+                if checkpoint:
+                    with open(checkpoint + '.tmp', 'w') as f:
+                        json.dump(state, f)
+                    os.replace(checkpoint + '.tmp', checkpoint)
+                log.info('Exported {count} items of "{space}"'.format(count=count, space=space))
+                if 'next' not in data['_links'] or not data['results']:
+                    return count
+
     def page_exists(self, space, title):
         try:
             self.get_page_by_title(space, title)
@@ -162,6 +297,37 @@ class Confluence(AtlassianRestAPI):
                 if e.doc != '':
                     raise e
 
+    def set_pages_restrictions(self, page_ids, operation, add_groups=None, add_users=None,
+                               remove_groups=None, remove_users=None, workers=8):
+        """
+        Adds and removes ``operation`` restrictions on many pages, ``workers`` pages at a time.
+        The current restrictions of each page are read first, so only the changes are sent.
+        Yields ``{'page_id', 'added', 'removed', 'error'}`` for every page as it completes, where ``added`` and
+        ``removed`` are ``{'groups': [...], 'users': [...]}``.
+        """
+        assert operation in {'read', 'update'}
+        expand = '{0}.restrictions.user,{0}.restrictions.group'.format(operation)
+
+        def apply(page_id):
+            try:
+                restrictions = self.get_page_restrictions(page_id, expand=expand)[operation]['restrictions']
+                groups = {group['name'] for group in restrictions['group']['results']}
+                users = {user.get('username') for user in restrictions['user']['results']}
+                added = {'groups': [group for group in add_groups or [] if group not in groups],
+                         'users': [user for user in add_users or [] if user not in users]}
+                removed = {'groups': [group for group in remove_groups or [] if group in groups],
+                           'users': [user for user in remove_users or [] if user in users]}
+                if added['groups'] or added['users']:
+                    self.add_page_restrictions(page_id, operation, groups=added['groups'], users=added['users'])
+                self.delete_page_restrictions(page_id, operation, groups=removed['groups'], users=removed['users'])
+            except HTTPError as e:
+                log.warning('Could not change restrictions of {0}: {1}'.format(page_id, e))
+                return {'page_id': page_id, 'added': None, 'removed': None, 'error': str(e)}
+            return {'page_id': page_id, 'added': added, 'removed': removed, 'error': None}
+
+        for result in self.imap(apply, page_ids, workers=workers, ordered=False):
+            yield result
+
     def create_page(self, space, parent_id, title, body, type='page'):
         log.info('Creating {type} "{space}" -> "{title}"'.format(space=space, title=title, type=type))
         return self.post('/rest/api/content/', data={
@@ -177,47 +343,84 @@ class Confluence(AtlassianRestAPI):
         return self.get('/rest/api/content/{0}/history'.format(page_id))
 
     def is_page_content_is_already_updated(self, page_id, body):
-        confluence_content = self.get_page_by_id(page_id, expand='body.storage')['body']['storage']['value']
+        return self.is_page_body_equal(self.get_page_by_id(page_id, expand='body.storage'), body)
+
+    def is_page_body_equal(self, page, body):
+        confluence_content = page['body']['storage']['value']
         confluence_content = confluence_content.replace('&oacute;', 'ó')
 
         log.debug('Old Content: """{body}"""'.format(body=confluence_content))
         log.debug('New Content: """{body}"""'.format(body=body))
 
         if confluence_content.strip() == body.strip():
-            log.warning('Content of {page_id} is exactly the same'.format(page_id=page_id))
+            log.warning('Content of {page_id} is exactly the same'.format(page_id=page['id']))
             return True
         else:
-            log.info('Content of {page_id} differs'.format(page_id=page_id))
+            log.info('Content of {page_id} differs'.format(page_id=page['id']))
             return False
 
+    def get_page_for_update(self, page_id, body, body_hash, hash_store=None):
+        """
+        Returns the page with its version and whether its body already is ``body``, using ``hash_store`` as described
+        in ``update_page`` to avoid downloading the body.
+        """
+        known = hash_store.get(str(page_id)) if hash_store is not None else None
+        if known is not None:
+            page = self.get_page_by_id(page_id, representation=None, expand='version')
+            if page['version']['number'] == known[0]:
+                if known[1] != body_hash:
+                    return page, False
+                log.warning('Content of {page_id} is unchanged since version {version}'.format(
+                    page_id=page_id, version=known[0]))
+                return page, True
+
+        page = self.get_page_by_id(page_id, expand='version')
+        if not self.is_page_body_equal(page, body):
+            return page, False
+        if hash_store is not None:
+            hash_store[str(page_id)] = (page['version']['number'], body_hash)
+        return page, True
+
     def update_page(self, parent_id, page_id, title, body, type='page',
-                    is_already_updated=None):
+                    is_already_updated=None, hash_store=None):
+        """
+        Updates a page unless its body is already ``body``. The current body and version are fetched with one request.
+        :param hash_store: optional mapping (e.g. a ``shelve``) remembering ``(version, sha256 of body)`` per page id.
+                           For a page found in it only the version is fetched, and when neither the version nor the
+                           hash changed the update is skipped without downloading the body; the page is then returned
+                           without its body.
+        """
         log.info('Updating {type} "{title}"'.format(title=title, type=type))
+        body_hash = hashlib.sha256(body.strip().encode('utf-8')).hexdigest()
 
-        if is_already_updated is None:
-            def is_already_updated(self_, page_id_, body_):
-                return self_.is_page_content_is_already_updated(page_id_,
-                                                                body_)
-
-        if is_already_updated(self, page_id, body):
-            return self.get_page_by_id(page_id)
+        if is_already_updated is not None:
+            if is_already_updated(self, page_id, body):
+                return self.get_page_by_id(page_id)
+            page = self.get_page_by_id(page_id, representation=None, expand='version')
         else:
-            version = self.history(page_id)['lastUpdated']['number'] + 1
+            page, unchanged = self.get_page_for_update(page_id, body, body_hash, hash_store)
+            if unchanged:
+                return page
 
-            data = {
-                'id': page_id,
-                'type': type,
-                'title': title,
-                'body': {'storage': {
-                    'value': body,
-                    'representation': 'storage'}},
-                'version': {'number': version}
-            }
+        version = page['version']['number'] + 1
 
-            if parent_id:
-                data['ancestors'] = [{'type': 'page', 'id': parent_id}]
+        data = {
+            'id': page_id,
+            'type': type,
+            'title': title,
+            'body': {'storage': {
+                'value': body,
+                'representation': 'storage'}},
+            'version': {'number': version}
+        }
 
-            return self.put('/rest/api/content/{0}'.format(page_id), data=data)
+        if parent_id:
+            data['ancestors'] = [{'type': 'page', 'id': parent_id}]
+
+        result = self.put('/rest/api/content/{0}'.format(page_id), data=data)
+        if hash_store is not None:
+            hash_store[str(page_id)] = (version, body_hash)
+        return result
 
     def update_or_create(self, parent_id, title, body):
         space = self.get_page_space(parent_id)
@@ -233,3 +436,56 @@ class Confluence(AtlassianRestAPI):
             url=result['_links']['tinyui']))
 
         return result
+
+    def publish_tree_item(self, space, item, ids, failed, hash_store=None):
+        """
+        Creates or updates one ``(parent, title, body)`` item of ``publish_tree``, given the ids of the pages known
+        by title and the titles that failed to publish.
+        """
+        parent, title, body = item
+        if parent in failed:
+            return {'title': title, 'id': None, 'action': None, 'error': 'Parent "{0}" failed'.format(parent)}
+        parent_id = ids.get(parent, parent)
+        try:
+            if title in ids:
+                self.update_page(parent_id, ids[title], title, body, hash_store=hash_store)
+                return {'title': title, 'id': ids[title], 'action': 'updated', 'error': None}
+            page = self.create_page(space, parent_id, title, body)
+            return {'title': title, 'id': page['id'], 'action': 'created', 'error': None}
+        except HTTPError as e:
+            return {'title': title, 'id': None, 'action': None, 'error': str(e)}
+
+    def publish_tree(self, space, items, workers=8, hash_store=None):
+        """
+        Creates or updates many pages of ``space`` at once. ``items`` are ``(parent, title, body)`` where ``parent``
+        is the title of another item or of a page already in the space, or a page id.
+        The titles of the space are listed once, then the items are published level by level on ``workers``
+        threads, so parents always exist before their children.
+        Yields ``{'title', 'id', 'action': 'created' or 'updated', 'error'}`` for every item as it completes.
+        ``hash_store`` is passed to ``update_page`` and only used by one thread at a time.
+        """
+        if hash_store is not None:
+            hash_store = LockedHashStore(hash_store)
+        ids = {page['title']: page['id'] for page in self.get_space_content_iter(space)}
+        pending = list(items)
+        waiting = {title for _, title, _ in pending}
+        failed = set()
+
+        def publish(item):
+            return self.publish_tree_item(space, item, ids, failed, hash_store=hash_store)
+
+        while pending:
+            ready = [item for item in pending if item[0] not in waiting]
+            if not ready:
+                for _, title, _ in pending:
+                    yield {'title': title, 'id': None, 'action': None, 'error': 'Parent is part of a cycle'}
+                return
+            pending = [item for item in pending if item[0] in waiting]
+            log.info('Publishing {count} pages to "{space}"'.format(count=len(ready), space=space))
+            for result in self.imap(publish, ready, workers=workers, ordered=False):
+                if result['error']:
+                    failed.add(result['title'])
+                else:
+                    ids[result['title']] = result['id']
+                waiting.discard(result['title'])
+                yield result
@@ -1,3 +1,4 @@
+import itertools
 import logging
 from requests.exceptions import HTTPError
 from atlassian import AtlassianRestAPI
@@ -8,6 +9,11 @@ log = logging.getLogger('atlassian.jira')
 
 class Jira(AtlassianRestAPI):
 
+    def __init__(self, *args, **kwargs):
+        super(Jira, self).__init__(*args, **kwargs)
+        self.cached_transitions = self.memoize(self.get_issue_transitions_by_status, key=self.transition_context)
+        self.link_types = None
+
     def reindex_status(self):
         return self.get('/rest/api/2/reindex')
 
@@ -20,6 +26,30 @@ class Jira(AtlassianRestAPI):
             fields=fields,
             jql=jql))
 
+    def jql_iter(self, jql, fields='*all', page_size=100, prefetch=False):
+        """
+        Yields issues matching ``jql`` page by page, following ``startAt``/``maxResults``.
+        The page size may be lowered by the server; the size it reports is used for the following pages.
+        :param prefetch: fetch the next page on a background thread while the current one is consumed
+        """
+        def page(start):
+            return self.get('/rest/api/2/search', params={
+                'jql': jql,
+                'fields': fields,
+                'startAt': start,
+                'maxResults': page_size})
+
+        first = page(0)
+        for issue in first['issues']:
+            yield issue
+        if not first['issues']:
+            return
+
+        step = first.get('maxResults') or len(first['issues'])
+        for data in self.imap(page, range(step, first['total'], step), workers=1 if prefetch else 0):
+            for issue in data['issues']:
+                yield issue
+
     def projects(self):
         return self.get('/rest/api/2/project')
 
@@ -39,18 +69,27 @@ class Jira(AtlassianRestAPI):
     def update_issue_field(self, key, fields='*all'):
         return self.put('/rest/api/2/issue/{0}'.format(key), data={'fields': fields})
 
-    def project_leaders(self):
-        for project in self.projects():
+    def project_leaders(self, workers=8, ordered=True):
+        """
+        Yields the leader of every project. Projects are looked up on ``workers`` threads and each leader is fetched
+        only once per call. With ``ordered=False`` results are yielded as soon as they are ready.
+        """
+        user = self.memoize(self.user)
+
+        def leader(project):
             key = project['key']
             project_data = self.project(key)
-            lead = self.user(project_data['lead']['key'])
-            yield {
+            lead = user(project_data['lead']['key'])
+            return {
                 'project_key': key,
                 'project_name': project['name'],
                 'lead_name': lead['displayName'],
                 'lead_key': lead['key'],
                 'lead_email': lead['emailAddress']}
 
+        for data in self.imap(leader, self.projects(), workers=workers, ordered=ordered):
+            yield data
+
     def rename_sprint(self, sprint_id, name, start_date, end_date):
         return self.put('/rest/greenhopper/1.0/sprint/{0}'.format(sprint_id), data={
             'name': name,
@@ -63,7 +102,7 @@ class Jira(AtlassianRestAPI):
 
     def get_project_issuekey_all(self, project):
         jql = 'project = {project} ORDER BY issuekey ASC'.format(project=project)
-        return [issue['key'] for issue in self.jql(jql)['issues']]
+        return [issue['key'] for issue in self.jql_iter(jql, fields='*none')]
 
     def get_project_issues_count(self, project):
         jql = 'project = {project}'.format(project=project)
@@ -71,7 +110,7 @@ class Jira(AtlassianRestAPI):
 
     def get_all_project_issues(self, project, fields='*all'):
         jql = 'project = {project} ORDER BY key'.format(project=project)
-        return self.jql(jql, fields=fields)['issues']
+        return list(self.jql_iter(jql, fields=fields))
 
     def issue_exists(self, issuekey):
         try:
@@ -105,6 +144,41 @@ class Jira(AtlassianRestAPI):
         url = '/rest/api/2/issue/'
         return self.post(url, data={'fields': fields})
 
+    def issue_create_bulk(self, issues, chunk_size=50, workers=4):
+        """
+        Creates issues through /rest/api/2/issue/bulk, ``chunk_size`` issues per request and up to ``workers``
+        requests at a time. One invalid issue doesn't fail the others.
+        Yields a result for every input as its chunk completes: ``{'index': position in issues, 'fields': fields,
+        'issue': created issue or None, 'error': None or the error reported for that issue}``
+        """
+        url = '/rest/api/2/issue/bulk'
+        items = enumerate(issues)
+        chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+        def create(chunk):
+            log.warning('Creating {count} issues in bulk'.format(count=len(chunk)))
+            try:
+                response = self.post(url, data={'issueUpdates': [{'fields': fields} for _, fields in chunk]})
+            except HTTPError as e:
+                try:
+                    response = e.response.json()
+                except ValueError:
+                    response = None
+                if not response or 'errors' not in response:
+                    return [{'index': index, 'fields': fields, 'issue': None, 'error': str(e)}
+                            for index, fields in chunk]
+
+            errors = {error['failedElementNumber']: error for error in response.get('errors', [])}
+            created = iter(response.get('issues', []))
+            return [{'index': index,
+                     'fields': fields,
+                     'issue': None if number in errors else next(created, None),
+                     'error': errors.get(number)} for number, (index, fields) in enumerate(chunk)]
+
+        for results in self.imap(create, chunks, workers=workers, ordered=False):
+            for result in results:
+                yield result
+
     def issue_create_or_update(self, fields):
         issuekey = fields.get('issuekey', None)
 
@@ -121,6 +195,119 @@ class Jira(AtlassianRestAPI):
         del fields['issuekey']
         return self.issue_update(issuekey, fields)
 
+    def issues_by_keys(self, issuekeys, fields='*none', chunk_size=500, workers=4):
+        """
+        Yields the issues among ``issuekeys`` that exist, using one ``key in (...)`` search per ``chunk_size`` keys
+        instead of one request per key.
+        """
+        keys = iter(issuekeys)
+        chunks = iter(lambda: list(itertools.islice(keys, chunk_size)), [])
+
+        def search(chunk):
+            found = []
+            while True:
+                data = self.post('/rest/api/2/search', data={
+                    'jql': 'key in ({keys})'.format(keys=', '.join(chunk)),
+                    'fields': fields.split(','),
+                    'startAt': len(found),
+                    'maxResults': len(chunk),
+                    'validateQuery': False})
+                found += data['issues']
+                if not data['issues'] or len(found) >= data['total']:
+                    return found
+
+        for found in self.imap(search, chunks, workers=workers, ordered=False):
+            for issue in found:
+                yield issue
+
+    def issues_by_requested_keys(self, issuekeys, fields='*none', chunk_size=500, workers=4):
+        """
+        Returns ``[(issuekey, issue or None)]`` for every key of ``issuekeys``. Issues are found with
+        ``issues_by_keys``; the few keys it doesn't return, such as those of moved issues, are looked up one by one,
+        so a moved issue is paired with the key asked for rather than its new one.
+        """
+        issuekeys = list(issuekeys)
+        found = {issue['key'].upper(): issue
+                 for issue in self.issues_by_keys(issuekeys, fields=fields, chunk_size=chunk_size, workers=workers)}
+
+        def lookup(issuekey):
+            issue = found.get(issuekey.upper())
+            if issue is not None:
+                return issuekey, issue
+            try:
+                return issuekey, self.issue(issuekey, fields=fields)
+            except HTTPError:
+                return issuekey, None
+
+        return list(self.imap(lookup, issuekeys, workers=workers))
+
+    def existing_issue_keys(self, issuekeys, chunk_size=500, workers=4):
+        """
+        Returns which of ``issuekeys`` exist.
+        """
+        return {issue['key'] for issue in self.issues_by_keys(issuekeys, chunk_size=chunk_size, workers=workers)}
+
+    def issue_actions(self, issuekeys, chunk_size=500, workers=4):
+        """
+        Returns ``{issuekey: 'create', 'update' or 'skip'}``, decided like ``issue_create_or_update`` does.
+        Keys are looked up with ``existing_issue_keys``; the few it doesn't return, such as moved issues or issues
+        the user can't browse, are checked one by one with ``issue_exists`` and ``issue_deleted``.
+        """
+        issuekeys = set(issuekeys)
+        existing = self.existing_issue_keys(issuekeys, chunk_size=chunk_size, workers=workers)
+        actions = {issuekey: 'update' for issuekey in issuekeys if issuekey.upper() in existing}
+
+        def check(issuekey):
+            if not self.issue_exists(issuekey):
+                return issuekey, 'create'
+            return issuekey, 'skip' if self.issue_deleted(issuekey) else 'update'
+
+        missing = [issuekey for issuekey in issuekeys if issuekey not in actions]
+        actions.update(self.imap(check, missing, workers=workers, ordered=False))
+        return actions
+
+    def issue_create_or_update_bulk(self, records, chunk_size=500, workers=4):
+        """
+        Bulk version of ``issue_create_or_update``. What to do with every ``issuekey`` is resolved with
+        ``issue_actions``, new issues are created with ``issue_create_bulk`` and existing ones updated
+        concurrently. Yields ``{'index', 'issuekey', 'action', 'issue', 'error'}`` for every record as it completes;
+        records of deleted issues are skipped with ``action`` ``'skip'``.
+        """
+        records = list(records)
+        actions = self.issue_actions({fields['issuekey'] for fields in records if fields.get('issuekey')},
+                                     chunk_size=chunk_size, workers=workers)
+        creates, updates = [], []
+        for index, fields in enumerate(records):
+            fields = dict(fields)
+            issuekey = fields.pop('issuekey', None)
+            action = actions[issuekey] if issuekey else 'create'
+            if action == 'skip':
+                log.warning('Issue "{issuekey}" deleted, skipping'.format(issuekey=issuekey))
+                yield {'index': index, 'issuekey': issuekey, 'action': 'skip', 'issue': None, 'error': None}
+            elif action == 'update':
+                updates.append((index, issuekey, fields))
+            else:
+                creates.append((index, issuekey, fields))
+        log.info('{creates} issues to create, {updates} to update'.format(creates=len(creates), updates=len(updates)))
+
+        for result in self.issue_create_bulk([fields for _, _, fields in creates], workers=workers):
+            index, issuekey, _ = creates[result['index']]
+            yield {'index': index, 'issuekey': issuekey, 'action': 'create',
+                   'issue': result['issue'], 'error': result['error']}
+
+        def update(item):
+            index, issuekey, fields = item
+            try:
+                self.issue_update(issuekey, fields)
+                error = None
+            except HTTPError as e:
+                error = str(e)
+            return {'index': index, 'issuekey': issuekey, 'action': 'update', 'issue': {'key': issuekey},
+                    'error': error}
+
+        for result in self.imap(update, updates, workers=workers, ordered=False):
+            yield result
+
     def get_issue_transitions(self, issuekey):
         url = '/rest/api/2/issue/{issuekey}?expand=transitions.fields&fields=status'.format(issuekey=issuekey)
         return [{'name': transition['name'], 'id': int(transition['id']),
@@ -143,6 +330,65 @@ class Jira(AtlassianRestAPI):
         transition_id = self.get_transition_id_to_status_name(issuekey, status_name)
         return self.post(url, data={'transition': {'id': transition_id}})
 
+    def get_issue_transitions_by_status(self, issue):
+        return {transition['to'].lower(): transition['id'] for transition in self.get_issue_transitions(issue['key'])}
+
+    @staticmethod
+    def transition_context(issue):
+        fields = issue['fields']
+        return fields['project']['key'], fields['issuetype']['id'], fields['status']['id']
+
+    def get_cached_transition_id(self, issue, status_name):
+        """
+        Returns the id of the transition to ``status_name`` for an issue fetched with the ``project``, ``issuetype``
+        and ``status`` fields. Transitions are looked up once per (project, issue type, status) and then cached,
+        also when several threads ask for the same one at once.
+        """
+        return self.cached_transitions(issue).get(status_name.lower())
+
+    def invalidate_transition_cache(self, issue=None):
+        if issue is None:
+            self.cached_transitions.clear()
+        else:
+            self.cached_transitions.forget(issue)
+
+    def set_issue_status_bulk(self, issuekeys, status_name, workers=8, chunk_size=500):
+        """
+        Transitions many issues to ``status_name``. Current statuses are read with one search per ``chunk_size``
+        issues, transition ids come from ``get_cached_transition_id`` and the transitions are posted on ``workers``
+        threads. A failed transition refreshes the cached transitions and is tried once more.
+        Yields ``{'issuekey': key, 'error': None or message}`` for every issue as it completes, under the key it was
+        asked for also when the issue has moved.
+        """
+        issues = []
+        for issuekey, issue in self.issues_by_requested_keys(issuekeys, fields='project,issuetype,status',
+                                                             chunk_size=chunk_size, workers=workers):
+            if issue is None:
+                yield {'issuekey': issuekey, 'error': 'Issue does not exist'}
+            else:
+                issues.append((issuekey, issue))
+
+        def transition(item):
+            issuekey, issue = item
+            url = '/rest/api/2/issue/{issuekey}/transitions'.format(issuekey=issue['key'])
+            error = None
+            for attempt in range(2):
+                if attempt:
+                    self.invalidate_transition_cache(issue)
+                try:
+                    transition_id = self.get_cached_transition_id(issue, status_name)
+                    if transition_id is None:
+                        error = 'No transition to "{status}"'.format(status=status_name)
+                        continue
+                    self.post(url, data={'transition': {'id': transition_id}})
+                    return {'issuekey': issuekey, 'error': None}
+                except HTTPError as e:
+                    error = str(e)
+            return {'issuekey': issuekey, 'error': error}
+
+        for result in self.imap(transition, issues, workers=workers, ordered=False):
+            yield result
+
     def get_issue_status(self, issuekey):
         url = '/rest/api/2/issue/{issuekey}?fields=status'.format(issuekey=issuekey)
         return self.get(url)['fields']['status']['name']
@@ -155,13 +401,53 @@ class Jira(AtlassianRestAPI):
         _ = [type['name'] for type in self.issue_get_issue_link_types()]
         return _
 
-    def issue_create_link(self, inwardIssueKey, outwardIssueKey, typeName):
+    def refresh_issue_link_types(self):
+        self.link_types = {link_type['name'].lower(): link_type for link_type in self.issue_get_issue_link_types()}
+        return self.link_types
+
+    def get_issue_link_type(self, name, refresh=False, reload_unknown=True):
+        """
+        Returns the issue link type called ``name``, ignoring case, or None. The link types are downloaded once per
+        client and reloaded with ``refresh``, or when ``name`` is unknown unless ``reload_unknown`` is False.
+        """
+        link_types = self.link_types
+        if refresh or link_types is None:
+            link_types = self.refresh_issue_link_types()
+            refresh = True
+        link_type = link_types.get(name.lower())
+        if link_type is None and reload_unknown and not refresh:
+            link_type = self.refresh_issue_link_types().get(name.lower())
+        return link_type
+
+    def issue_create_link(self, inwardIssueKey, outwardIssueKey, typeName, reload_unknown=True):
+        """
+        ``typeName`` is matched ignoring case and sent as the link type is spelled on the server.
+        :raises ValueError: when no issue link type is called ``typeName``
+        """
         url = '/rest/api/2/issueLink'
 
-        assert typeName.lower() in [t.lower() for t in self.issue_get_issue_link_types_names()]
+        link_type = self.get_issue_link_type(typeName, reload_unknown=reload_unknown)
+        if link_type is None:
+            raise ValueError('Unknown issue link type "{0}"'.format(typeName))
 
         return self.post(url, data={
-            'type': {'name': typeName},
+            'type': {'name': link_type['name']},
             'inwardIssue': {'key': inwardIssueKey},
             'outwardIssue': {'key': outwardIssueKey}
         })
+
+    def issue_create_links(self, links, workers=8):
+        """
+        Creates many links, each given as ``(inwardIssueKey, outwardIssueKey, typeName)``, on ``workers`` threads.
+        The link types are reloaded once per call. Returns the links that failed as a list of ``(link, error)``.
+        """
+        def create(link):
+            try:
+                self.issue_create_link(*link, reload_unknown=False)
+            except (HTTPError, ValueError) as e:
+                log.warning('Could not link {0}: {1}'.format(link, e))
+                return link, e
+
+        # loaded once for all links, so unknown type names don't reload the list for every link
+        self.refresh_issue_link_types()
+        return [failure for failure in self.imap(create, links, workers=workers, ordered=False) if failure]
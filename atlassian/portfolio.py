@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 from atlassian import AtlassianRestAPI
 
 
@@ -7,10 +9,44 @@ log = logging.getLogger('atlassian.portfolio')
 
 class Portfolio(AtlassianRestAPI):
 
-    def __init__(self, plan_id, *args, **kwargs):
+    def __init__(self, plan_id, *args, cache_ttl=None, **kwargs):
         self.plan_id = plan_id
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
         super(Portfolio, self).__init__(*args, **kwargs)
 
+    def cached(self, name):
+        """
+        Returns the plan's ``stages``, ``teams``, ``streams``, ``themes`` or ``persons`` indexed by id.
+        The collection is downloaded on first use and kept for ``cache_ttl`` seconds (until invalidated by default).
+        """
+        with self._cache_lock:
+            entry = self._cache.get(name)
+            if entry is None or (self.cache_ttl is not None and time.monotonic() - entry[0] > self.cache_ttl):
+                collection = getattr(self, 'get_{0}'.format(name))()['collection']
+                entry = (time.monotonic(), {str(item['id']): item for item in collection})
+                self._cache[name] = entry
+            return entry[1]
+
+    def cached_item(self, name, item_id):
+        """
+        Looks up one object of a cached collection. An unknown id reloads the collection once, in case the object
+        was added after it was cached.
+        """
+        try:
+            return self.cached(name)[str(item_id)]
+        except KeyError:
+            self.invalidate_cache(name)
+            return self.cached(name)[str(item_id)]
+
+    def invalidate_cache(self, name=None):
+        with self._cache_lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
     def get_epic(self, epic):
         key = [x.get('link', None) for x in epic.get('links', [])]
         estimates = self.get_estimates_dict(epic['estimates'])
@@ -36,8 +72,7 @@ class Portfolio(AtlassianRestAPI):
         return self.get(url)
 
     def get_team_name(self, team_id):
-        all_teams = self.get_teams()['collection']
-        return [team['title'] for team in all_teams if team['id'] == str(team_id)][0]
+        return self.cached_item('teams', team_id)['title']
 
     def get_config(self):
         url = '/rest/roadmap/1.0/plans/{0}/config.json'.format(self.plan_id)
@@ -75,8 +110,7 @@ class Portfolio(AtlassianRestAPI):
         return self.get(url)
 
     def get_stage_name(self, stage_id):
-        all_stages = self.get_stages()['collection']
-        return [stage['title'] for stage in all_stages if stage['id'] == str(stage_id)][0]
+        return self.cached_item('stages', stage_id)['title']
 
     def get_estimates_dict(self, estimates):
         return {self.get_stage_name(stage['targetId']): stage['value'] for stage in estimates['stages']}
@@ -0,0 +1,120 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+
+
+log = logging.getLogger('atlassian.ratelimit')
+
+
+class RateLimiter:
+    """Adaptive token bucket, passed as ``AtlassianRestAPI(rate_limiter=...)``.
+
+    One limiter may be shared by any number of clients and threads talking to the same server.
+    The rate (requests per second) adapts AIMD-style: each successful response raises it by about
+    ``increase`` per second, up to ``max_rate``, and each 429/503 response multiplies it by ``decrease``.
+    ``Retry-After`` pauses every caller, and Jira Cloud's ``X-RateLimit-FillRate`` /
+    ``X-RateLimit-Interval-Seconds`` cap the rate at what the server grants.
+    Idempotent requests answered with 429/503 are retried up to ``max_retries`` times with jittered
+    exponential backoff.
+    """
+    IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+    RETRY_STATUS_CODES = {429, 503}
+
+    def __init__(self, rate=10.0, burst=None, min_rate=0.5, max_rate=None, increase=1.0, decrease=0.5,
+                 max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.rate = float(rate)
+        self.burst = burst or max(1.0, self.rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def update(self, response):
+        """
+        Adapts the rate to the status and rate limit headers of ``response``.
+        """
+        headers = response.headers
+        with self._lock:
+            if response.status_code in self.RETRY_STATUS_CODES:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                retry_after = self.parse_retry_after(headers.get('Retry-After'))
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                log.warning('Throttled with {0}, lowering rate to {1:.2f}/s'.format(response.status_code, self.rate))
+            else:
+                self.rate += self.increase / self.rate
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+            fill_rate = headers.get('X-RateLimit-FillRate')
+            if fill_rate:
+                interval = float(headers.get('X-RateLimit-Interval-Seconds', 1))
+                self.rate = max(self.min_rate, min(self.rate, float(fill_rate) / interval))
+            remaining = headers.get('X-RateLimit-Remaining')
+            if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+                self.tokens = min(self.tokens, 0)
+
+    def retry(self, method, response, attempt):
+        """
+        Returns True, after waiting, when ``response`` was throttled and the request should be sent again.
+        """
+        retryable = response.status_code in self.RETRY_STATUS_CODES and method.upper() in self.IDEMPOTENT_METHODS
+        if not retryable or attempt >= self.max_retries:
+            return False
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+        log.info('Retrying {0} {1} in {2:.1f}s'.format(method, response.url, delay))
+        time.sleep(delay)
+        return True
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Returns the number of seconds to wait from a ``Retry-After`` header given as seconds or as an HTTP date.
+
+        >>> RateLimiter.parse_retry_after('2.5'), RateLimiter.parse_retry_after('-1')
+        (2.5, 0.0)
+        >>> RateLimiter.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT')
+        0.0
+        >>> 50 < RateLimiter.parse_retry_after(email.utils.formatdate(time.time() + 60, usegmt=True)) <= 60
+        True
+        >>> RateLimiter.parse_retry_after(None), RateLimiter.parse_retry_after('soon')
+        (None, None)
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, date.timestamp() - time.time())
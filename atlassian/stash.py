@@ -1,4 +1,8 @@
+import itertools
 import logging
+import os
+from contextlib import closing
+from requests.exceptions import HTTPError
 from atlassian import AtlassianRestAPI
 
 
@@ -7,28 +11,89 @@ log = logging.getLogger('atlassian.stash')
 
 class Stash(AtlassianRestAPI):
 
-    def project_list(self):
-        return self.get('/rest/api/1.0/projects')['values']
+    def paged(self, url, params=None, limit=None, page_size=500, lookahead=0):
+        """
+        Yields the ``values`` of a paged resource, following ``isLastPage``/``nextPageStart``.
+        :param limit: stop after this many items; all items by default
+        :param page_size: items requested per page, the server may return fewer
+        :param lookahead: number of further pages requested in the background while the current one is consumed.
+                          Pages are requested by offset, so only use it where ``nextPageStart`` is ``start + limit``
+
+        >>> stash = Stash('https://stash.example.com', 'admin', 'admin')
+        >>> requested = []
+        >>> def get(url, params=None):
+        ...     start, limit = params['start'], params['limit']
+        ...     requested.append(start)
+        ...     return {'values': list(range(start, min(start + limit, 10))), 'limit': limit,
+        ...             'isLastPage': start + limit >= 10, 'nextPageStart': start + limit}
+        >>> stash.get = get
+        >>> list(stash.paged('/rest/api/1.0/projects', page_size=4)), requested
+        ([0, 1, 2, 3, 4, 5, 6, 7, 8, 9], [0, 4, 8])
+        >>> requested = []
+        >>> list(stash.paged('/rest/api/1.0/projects', limit=5, page_size=4)), requested
+        ([0, 1, 2, 3, 4], [0, 4])
+        >>> requested = []
+        >>> list(stash.paged('/rest/api/1.0/projects', page_size=3, lookahead=2))
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        >>> set(requested) >= {0, 3, 6, 9}
+        True
+        >>> list(stash.paged('/rest/api/1.0/projects', limit=7, page_size=3, lookahead=2))
+        [0, 1, 2, 3, 4, 5, 6]
+        """
+        params = dict(params or {})
+        if limit is not None:
+            page_size = min(page_size, limit)
+
+        def page(start):
+            return self.get(url, params=dict(params, start=start, limit=page_size))
+
+        count = 0
+        pages = None
+        data = page(0)
+        try:
+            while True:
+                for value in data['values']:
+                    yield value
+                    count += 1
+                    if count == limit:
+                        return
+                if data.get('isLastPage', True):
+                    return
+                if lookahead and pages is None:
+                    step = data.get('limit') or page_size
+                    pages = self.imap(page, itertools.count(data['nextPageStart'], step), workers=lookahead)
+                data = next(pages) if pages is not None else page(data['nextPageStart'])
+        finally:
+            if pages is not None:
+                pages.close()
+
+    def project_list(self, limit=None):
+        return list(self.paged('/rest/api/1.0/projects', limit=limit))
 
     def project(self, key):
         url = '/rest/api/1.0/projects/{0}'.format(key)
         return self.get(url)['values']
 
-    def project_users(self, key, limit=99999):
-        url = '/rest/api/1.0/projects/{key}/permissions/users?limit={limit}'.format(key=key, limit=limit)
-        return self.get(url)['values']
+    def project_users(self, key, limit=None):
+        url = '/rest/api/1.0/projects/{key}/permissions/users'.format(key=key)
+        return list(self.paged(url, limit=limit))
 
-    def project_users_with_administrator_permissions(self, key):
+    def project_users_with_administrator_permissions(self, key, group_members=None):
+        """
+        :param group_members: function listing the members of a group, e.g. a memoized ``group_members``
+                              shared between several projects
+        """
+        group_members = group_members or self.group_members
         project_administrators = [user['user'] for user in self.project_users(key)
                                   if user['permission'] == 'PROJECT_ADMIN']
         for group in self.project_groups_with_administrator_permissions(key):
-            for user in self.group_members(group):
+            for user in group_members(group):
                 project_administrators.append(user)
         return project_administrators
 
-    def project_groups(self, key, limit=99999):
-        url = '/rest/api/1.0/projects/{key}/permissions/groups?limit={limit}'.format(key=key, limit=limit)
-        return self.get(url)['values']
+    def project_groups(self, key, limit=None):
+        url = '/rest/api/1.0/projects/{key}/permissions/groups'.format(key=key)
+        return list(self.paged(url, limit=limit))
 
     def project_groups_with_administrator_permissions(self, key):
         return [group['group']['name'] for group in self.project_groups(key) if group['permission'] == 'PROJECT_ADMIN']
@@ -40,34 +105,39 @@ class Stash(AtlassianRestAPI):
             'users': self.project_users(key),
             'groups': self.project_groups(key)}
 
-    def group_members(self, group, limit=99999):
-        url = '/rest/api/1.0/admin/groups/more-members?context={group}&limit={limit}'.format(group=group, limit=limit)
-        return self.get(url)['values']
+    def group_members(self, group, limit=None):
+        url = '/rest/api/1.0/admin/groups/more-members'
+        return list(self.paged(url, params={'context': group}, limit=limit))
 
-    def all_project_administrators(self):
-        for project in self.project_list():
+    def all_project_administrators(self, workers=8, ordered=True):
+        """
+        Yields the administrators of every project. Projects are processed on ``workers`` threads and the members of
+        each group are downloaded only once per call.
+        """
+        group_members = self.memoize(self.group_members)
+
+        def administrators(project):
             log.info('Processing project: {0} - {1}'.format(project['key'], project['name']))
-            yield {
+            users = self.project_users_with_administrator_permissions(project['key'], group_members=group_members)
+            return {
                 'project_key': project['key'],
                 'project_name': project['name'],
-                'project_administrators': [{'email': x['emailAddress'], 'name': x['displayName']}
-                                           for x in self.project_users_with_administrator_permissions(project['key'])]}
+                'project_administrators': [{'email': x['emailAddress'], 'name': x['displayName']} for x in users]}
+
+        for data in self.imap(administrators, self.project_list(), workers=workers, ordered=ordered):
+            yield data
 
-    def get_branches(self, project, repository, filter='', limit=99999):
-        url = '/rest/api/1.0/projects/{project}/repos/{repository}/branches?limit={limit}&filterText={filter}'.format(
+    def get_branches(self, project, repository, filter='', limit=None):
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/branches'.format(
             project=project,
-            repository=repository,
-            limit=limit,
-            filter=filter)
-        return self.get(url)['values']
+            repository=repository)
+        return list(self.paged(url, params={'filterText': filter}, limit=limit))
 
-    def get_tags(self, project, repository, filter='', limit=99999):
-        url = '/rest/api/1.0/projects/{project}/repos/{repository}/tags?limit={limit}&filterText={filter}'.format(
+    def get_tags(self, project, repository, filter='', limit=None):
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/tags'.format(
             project=project,
-            repository=repository,
-            limit=limit,
-            filter=filter)
-        return self.get(url)['values']
+            repository=repository)
+        return list(self.paged(url, params={'filterText': filter}, limit=limit))
 
     def get_diff(self, project, repository, path, hash_oldest, hash_newest):
         url = ('/rest/api/1.0/projects/{project}/repos/{repository}/'
@@ -79,25 +149,66 @@ class Stash(AtlassianRestAPI):
             hash_newest=hash_newest)
         return self.get(url)['diffs']
 
-    def get_commits(self, project, repository, hash_oldest, hash_newest, limit=99999):
-        url = ('/rest/api/1.0/projects/{project}/repos/{repository}/'
-               'commits?since={hash_oldest}&until={hash_newest}&limit={limit}').format(
+    def get_diff_iter(self, project, repository, path, hash_oldest, hash_newest):
+        """
+        Like ``get_diff`` but yields one file diff at a time while the response is decoded, so large diffs
+        never have to be held in memory at once.
+        """
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/compare/diff/{path}'.format(
             project=project,
             repository=repository,
-            hash_from=hash_oldest,
-            hash_to=hash_newest,
-            limit=limit)
-        return self.get(url)['values']
+            path=path)
+        return self.get_json_items(url, 'diffs', params={'from': hash_oldest, 'to': hash_newest})
 
-    def get_changelog(self, project, repository, ref_from, ref_to, limit=99999):
-        url = ('/rest/api/1.0/projects/{project}/repos/{repository}/'
-               'compare/commits?from={ref_from}&to={ref_to}&limit={limit}').format(
+    def get_commits(self, project, repository, hash_oldest, hash_newest, limit=None, lookahead=0):
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/commits'.format(
+            project=project,
+            repository=repository)
+        params = {'since': hash_oldest, 'until': hash_newest}
+        return list(self.paged(url, params=params, limit=limit, lookahead=lookahead))
+
+    def get_changelog(self, project, repository, ref_from, ref_to, limit=None, lookahead=0):
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/compare/commits'.format(
+            project=project,
+            repository=repository)
+        params = {'from': ref_from, 'to': ref_to}
+        return list(self.paged(url, params=params, limit=limit, lookahead=lookahead))
+
+    def get_commit(self, project, repository, commit_id):
+        url = '/rest/api/1.0/projects/{project}/repos/{repository}/commits/{commit_id}'.format(
             project=project,
             repository=repository,
-            ref_from=ref_from,
-            ref_to=ref_to,
-            limit=limit)
-        return self.get(url)['values']
+            commit_id=commit_id)
+        return self.get(url)
+
+    def sync_commits(self, project, repository, ref, store, lookahead=0):
+        """
+        Brings an ``atlassian.commitstore.CommitStore`` up to date with ``ref``: one request resolves the ref and only
+        commits added since the previous sync are downloaded.
+        :return: the commit id ``ref`` points to
+        """
+        tip = self.get_commit(project, repository, ref)['id']
+        known = store.get_tip(project, repository, ref)
+        if tip != known and not store.has_commit(tip):
+            url = '/rest/api/1.0/projects/{project}/repos/{repository}/commits'.format(
+                project=project,
+                repository=repository)
+            params = {'until': tip}
+            if known:
+                params['since'] = known
+            count = store.add_commits(self.paged(url, params=params, lookahead=lookahead))
+            log.info('Synced {count} new commits of {project}/{repository} {ref}'.format(
+                count=count, project=project, repository=repository, ref=ref))
+        store.set_tip(project, repository, ref, tip)
+        return tip
+
+    def get_changelog_cached(self, project, repository, ref_from, ref_to, store):
+        """
+        Same commits as ``get_changelog``, answered from a ``CommitStore`` after syncing both refs.
+        """
+        tip_from = self.sync_commits(project, repository, ref_from, store)
+        tip_to = self.sync_commits(project, repository, ref_to, store)
+        return store.log(tip_from, exclude=tip_to)
 
     def get_content_of_file(self, project, repository, filename):
         url = '/projects/{project}/repos/{repository}/browse/{filename}?raw'.format(
@@ -105,3 +216,100 @@ class Stash(AtlassianRestAPI):
             repository=repository,
             filename=filename)
         return self.get(url)
+
+    def get_content_of_file_response(self, project, repository, filename, start=0, if_range=None):
+        """
+        Requests the raw content of a file from byte ``start`` and returns the streamed response; close it when done.
+        With ``if_range``, an ETag or Last-Modified date, the server sends the whole file instead of the range when
+        the file has changed since.
+        """
+        url = '/projects/{project}/repos/{repository}/browse/{filename}'.format(
+            project=project,
+            repository=repository,
+            filename=filename)
+        headers = {'Accept': '*/*'}
+        if start:
+            headers['Range'] = 'bytes={0}-'.format(start)
+            if if_range:
+                headers['If-Range'] = if_range
+        return self.request('GET', path=url, flags=['raw'], headers=headers, stream=True)
+
+    def get_content_of_file_stream(self, project, repository, filename, chunk_size=1024 * 1024, start=0):
+        """
+        Yields the raw content of a file in chunks of ``chunk_size`` bytes, without reading it all into memory.
+        ``start`` skips that many bytes, using a ``Range`` request when the server supports it.
+        """
+        with closing(self.get_content_of_file_response(project, repository, filename, start=start)) as response:
+            # a server ignoring the Range header sends the whole file
+            skip = start if response.status_code != 206 else 0
+            for chunk in response.iter_content(chunk_size):
+                if skip:
+                    chunk, skip = chunk[skip:], max(0, skip - len(chunk))
+                if chunk:
+                    yield chunk
+
+    @staticmethod
+    def content_range_total(response):
+        """
+        Returns the total size from the ``Content-Range`` header of a 206 or 416 response, or None.
+        """
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    def download_file(self, project, repository, filename, dest, chunk_size=1024 * 1024, resume=False):
+        """
+        Writes the raw content of a file to ``dest``, a path, a binary file object or a file descriptor, chunk by
+        chunk. While a path is being downloaded, the ETag or Last-Modified date of the file is kept next to it in
+        ``<dest>.download``. If ``resume`` is set and that file exists, only the rest of a partial download is
+        requested, with ``If-Range`` so that a file changed in the meantime is downloaded again in full.
+        :return: number of bytes written
+        """
+        start, validator = 0, None
+        state = None if isinstance(dest, int) or hasattr(dest, 'write') else '{0}.download'.format(dest)
+        if resume and state and os.path.exists(dest) and os.path.exists(state):
+            with open(state) as f:
+                validator = f.read().strip() or None
+            start = os.path.getsize(dest) if validator else 0
+
+        try:
+            response = self.get_content_of_file_response(project, repository, filename, start=start,
+                                                         if_range=validator)
+        except HTTPError as e:
+            if not start or e.response.status_code != 416 or self.content_range_total(e.response) != start:
+                raise
+            log.info('{0} is already complete'.format(dest))
+            os.remove(state)
+            return 0
+
+        with closing(response):
+            if response.status_code != 206:
+                start = 0
+            if isinstance(dest, int):
+                out = os.fdopen(dest, 'wb', closefd=False)
+            elif not state:
+                out = dest
+            else:
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                with open(state, 'w') as f:
+                    f.write(validator or '')
+                out = open(dest, 'ab' if start else 'wb')
+            return self.write_response(response, out, chunk_size, close=out is not dest, state=state)
+
+    @staticmethod
+    def write_response(response, out, chunk_size, close, state=None):
+        """
+        Copies the body of a streamed ``response`` to ``out`` and, once it is complete, removes the ``state`` file.
+        """
+        written = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if close:
+                out.close()
+            else:
+                out.flush()
+        if state:
+            os.remove(state)
+        return written
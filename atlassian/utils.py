@@ -1,3 +1,5 @@
+import html
+import json
 import logging
 import re
 
@@ -5,6 +7,9 @@ import re
 
 log = logging.getLogger('atlassian.utils')
 
+email_regex = re.compile(r'^[A-Za-z0-9\.\+_-]+@[A-Za-z0-9\._-]+\.[a-zA-Z]*$')
+html_special_regex = re.compile(r'[&<>"\']')
+
 
 def is_email(string):
     """
@@ -15,9 +20,7 @@ def is_email(string):
     >>> is_email('firstname.lastname@domain.co.uk')
     True
     """
-    email_regex = r'^[A-Za-z0-9\.\+_-]+@[A-Za-z0-9\._-]+\.[a-zA-Z]*$'
-
-    if isinstance(string, str) and not re.match(email_regex, string):
+    if isinstance(string, str) and not email_regex.match(string):
         return False
     else:
         return True
@@ -124,3 +127,143 @@ def html_table_from_dict(data, ordering):
         html += html_row_with_ordered_headers(row, ordering)
 
     return html + '\n</tbody></table>'
+
+
+def html_cell(value):
+    """
+    Renders one table cell: text is escaped, e-mail addresses become links, lists become ``<ul>`` and dicts with
+    ``email``/``name`` keys become links or names.
+
+    >>> html_cell(['a<b', 'admin@example.com', {'name': 'Admin', 'email': 'admin@example.com'}, 7])
+    '<ul><li>a&lt;b</li><li><a href="mailto:admin@example.com">admin@example.com</a></li><li><a href="mailto:admin@example.com">Admin</a></li><li>7</li></ul>'
+    """
+    if not isinstance(value, str):
+        if isinstance(value, (list, tuple)):
+            return ''.join(['<ul>'] + ['<li>' + html_cell(item) + '</li>' for item in value] + ['</ul>'])
+        if isinstance(value, dict):
+            if value.get('email'):
+                return '<a href="mailto:{0}">{1}</a>'.format(html.escape(value['email']),
+                                                            html.escape(str(value.get('name') or value['email'])))
+            return html_cell(value.get('name', ''))
+        value = '' if value is None else str(value)
+    if '@' in value and email_regex.match(value):
+        return '<a href="mailto:{0}">{0}</a>'.format(html.escape(value))
+    if html_special_regex.search(value) is None:
+        return value
+    return html.escape(value)
+
+
+def iter_html_table(data, ordering):
+    """
+    Yields an HTML table row by row, so ``data`` may be a generator such as ``Jira.project_leaders()`` and the
+    table is never built in memory. ``ordering`` lists the keys shown as columns.
+
+    >>> list(iter_html_table(iter([{'key': 'A&B', 'lead': 'lead@example.com'}]), ['key', 'lead']))
+    ['<table><tbody>\\n<tr><th>Key</th><th>Lead</th></tr>\\n', '<tr><td>A&amp;B</td><td><a href="mailto:lead@example.com">lead@example.com</a></td></tr>\\n', '</tbody></table>']
+    """
+    yield '<table><tbody>\n<tr>{0}</tr>\n'.format(''.join(
+        '<th>{0}</th>'.format(html.escape(th.replace('_', ' ').title())) for th in ordering))
+    for row in data:
+        yield ''.join(['<tr>'] + ['<td>' + html_cell(row[key]) + '</td>' for key in ordering] + ['</tr>\n'])
+    yield '</tbody></table>'
+
+
+def write_html_table(data, ordering, fileobj):
+    """
+    Writes the table of ``iter_html_table`` to a text file object as it is rendered.
+    """
+    for chunk in iter_html_table(data, ordering):
+        fileobj.write(chunk)
+
+
+# a run of ignorable characters followed by a string or a bracket
+json_token_regex = re.compile(r'[^"\[\]{}]*("[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}])', re.DOTALL)
+
+
+def iter_json_array(chunks, key):
+    """
+    Decodes a JSON object arriving as text ``chunks`` and yields the items of its top-level array ``key`` one by
+    one, so only the current item is kept in memory.
+
+    >>> list(iter_json_array(['{"size": 2, "di', 'ffs": [{"a": "] {', '"}, {"b": [1, 2]}, 1', '2], "next": 1}'], 'diffs'))
+    [{'a': '] {'}, {'b': [1, 2]}, 12]
+    >>> list(iter_json_array(['{"diffs": [1.', '5]}'], 'diffs'))
+    [1.5]
+    >>> list(iter_json_array(['{"diffs": [12', '3, 1e', '3]}'], 'diffs'))
+    [123, 1000.0]
+    >>> list(iter_json_array(['{"values": ["x", "y"]}'], 'diffs'))
+    []
+    """
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    depth = 0
+    last_string = None
+
+    # tokenize the object only until the array is found
+    while True:
+        match = json_token_regex.match(buffer, position)
+        if match is None:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        token = match.group(1)
+        position = match.end()
+        if token[0] == '"':
+            if depth == 1:
+                last_string = token
+        elif token in '[{':
+            if depth == 1 and token == '[' and json.loads(last_string) == key:
+                break
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return
+
+    # then let the json module decode one item at a time; an incomplete item is retried only once the
+    # buffered text has doubled, so large items are not parsed over and over
+    decoder = json.JSONDecoder()
+    pending = []
+    pending_size = 0
+    retry_at = 0
+    finished = False
+    while True:
+        if pending and (finished or len(buffer) - position + pending_size >= retry_at):
+            buffer = buffer[position:] + ''.join(pending)
+            position = 0
+            pending = []
+            pending_size = 0
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer) and not pending:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if finished:
+                    raise
+                retry_at = 2 * (len(buffer) - position)
+            else:
+                # a number, true, false or null is only complete once a delimiter follows it,
+                # otherwise it may continue in the next chunk
+                if finished or (end < len(buffer) and (buffer[position] in '"[{' or buffer[end] in ' \t\r\n,]')):
+                    yield item
+                    position = end
+                    retry_at = 0
+                    continue
+                retry_at = len(buffer) - position + 1
+        elif finished:
+            raise ValueError('Unterminated JSON array "{0}"'.format(key))
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            finished = True
+        else:
+            pending.append(chunk)
+            pending_size += len(chunk)
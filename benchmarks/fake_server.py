@@ -0,0 +1,120 @@
+"""In-process stub of the Jira, Confluence, Stash and Bamboo endpoints used by the benchmarks.
+
+Every resource serves ``items`` generated records with a ``payload`` string of ``payload_size``
+bytes. Pages hold at most ``page_size`` records, whatever the client asks for, the way real servers
+cap their page size. Each request waits ``latency`` seconds before answering.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeAtlassianServer:
+
+    def __init__(self, items=1000, page_size=50, payload_size=512, latency=0.0, projects=50, leads=10):
+        self.items = items
+        self.page_size = page_size
+        self.payload = 'x' * payload_size
+        self.latency = latency
+        self.projects = projects
+        self.leads = leads
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.httpd.server_port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def window(self, start, limit):
+        start = int(start)
+        limit = min(int(limit), self.page_size)
+        return start, limit, list(range(start, min(start + limit, self.items)))
+
+    def route(self, path, query):
+        """
+        Returns the JSON document answering a GET of ``path`` or None for an unknown path.
+        """
+        arg = lambda name, default: query.get(name, [default])[0]
+
+        if path == '/rest/api/2/search':
+            start, limit, ids = self.window(arg('startAt', 0), arg('maxResults', 50))
+            return {'startAt': start, 'maxResults': limit, 'total': self.items,
+                    'issues': [{'id': str(i), 'key': 'DEMO-{0}'.format(i), 'fields': {'summary': self.payload}}
+                               for i in ids]}
+        if path == '/rest/api/2/project':
+            return [{'key': 'P{0}'.format(i), 'name': 'Project {0}'.format(i)} for i in range(self.projects)]
+        match = re.match(r'^/rest/api/2/project/P(\d+)$', path)
+        if match:
+            lead = 'lead{0}'.format(int(match.group(1)) % self.leads)
+            return {'key': 'P' + match.group(1), 'lead': {'key': lead}, 'description': self.payload}
+        if path == '/rest/api/2/user':
+            username = arg('username', '')
+            return {'key': username, 'displayName': username.title(),
+                    'emailAddress': '{0}@example.com'.format(username)}
+
+        if path in ('/rest/api/content/search', '/rest/api/content'):
+            start, limit, ids = self.window(arg('start', 0), arg('limit', 25))
+            links = {'next': '/rest/api/content?start={0}'.format(start + len(ids))} \
+                if start + len(ids) < self.items else {}
+            return {'start': start, 'limit': limit, 'size': len(ids), '_links': links,
+                    'results': [{'id': str(i), 'type': 'page', 'title': 'Page {0}'.format(i),
+                                 'body': {'storage': {'value': self.payload}}} for i in ids]}
+
+        if path.startswith('/rest/api/1.0/'):
+            start, limit, ids = self.window(arg('start', 0), arg('limit', 25))
+            last = start + len(ids) >= self.items
+            data = {'start': start, 'limit': limit, 'size': len(ids), 'isLastPage': last,
+                    'values': [{'id': '{0:040x}'.format(i), 'message': self.payload,
+                                'parents': [{'id': '{0:040x}'.format(i + 1)}]} for i in ids]}
+            if not last:
+                data['nextPageStart'] = start + len(ids)
+            return data
+
+        match = re.match(r'^/rest/api/latest/(project|plan|result)$', path)
+        if match:
+            start, limit, ids = self.window(arg('start-index', 0), arg('max-results', 25))
+            name = match.group(1)
+            return {name + 's': {'size': self.items, 'start-index': start, 'max-result': len(ids),
+                                 name: [{'key': 'K-{0}'.format(i), 'description': self.payload} for i in ids]}}
+        return None
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                # the client sends a body with every request, it has to be read for keep-alive to work
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                data = server.route(url.path, parse_qs(url.query))
+                body = json.dumps(data).encode('utf-8') if data is not None else b'{}'
+                self.send_response(200 if data is not None else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
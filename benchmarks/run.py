@@ -0,0 +1,221 @@
+"""Offline benchmarks of the main request and pagination paths against ``fake_server``.
+
+    python benchmarks/run.py                     # run everything and compare with baseline.json
+    python benchmarks/run.py jira_jql_iter       # run some scenarios only
+    python benchmarks/run.py --save-baseline     # record the current numbers as the baseline
+
+Every scenario runs in its own interpreter, so peak RSS is not inflated by the scenarios before it.
+A scenario is timed ``--repeat`` times, keeping the fastest run, and then run once more without latency under
+``tracemalloc`` to measure the peak of memory allocated by Python.
+Throughput and latency depend on the machine and its load, so record the baseline on the machine that compares
+against it; memory figures are stable enough to compare anywhere.
+The exit status is 1 when a metric is worse than the baseline by more than its tolerance.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from atlassian import Bamboo, Confluence, Jira, Stash  # noqa: E402
+from fake_server import FakeAtlassianServer  # noqa: E402
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# metric: (allowed relative change, True when higher is better)
+TOLERANCES = {
+    'requests_per_second': (0.4, True),
+    'p50_ms': (0.5, False),
+    'p99_ms': (2.0, False),
+    'peak_rss_mb': (0.15, False),
+    'allocated_mb': (0.1, False),
+}
+
+
+def jira_jql_iter(url, session):
+    client = Jira(url, 'admin', 'admin', session=session)
+    return len(list(client.jql_iter('project = DEMO', page_size=100)))
+
+
+def jira_jql_iter_prefetch(url, session):
+    client = Jira(url, 'admin', 'admin', session=session)
+    return len(list(client.jql_iter('project = DEMO', page_size=100, prefetch=True)))
+
+
+def jira_project_leaders(url, session):
+    client = Jira(url, 'admin', 'admin', session=session)
+    return len(list(client.project_leaders()))
+
+
+def confluence_search_iter(url, session):
+    client = Confluence(url, 'admin', 'admin', session=session)
+    return len(list(client.search_iter('type = page', expand='body.storage')))
+
+
+def confluence_space_content_iter(url, session):
+    client = Confluence(url, 'admin', 'admin', session=session)
+    return len(list(client.get_space_content_iter('DEMO', expand='body.storage')))
+
+
+def stash_commits(url, session):
+    client = Stash(url, 'admin', 'admin', session=session)
+    return len(client.get_commits('DEMO', 'repo', 'a' * 40, 'b' * 40))
+
+
+def stash_commits_lookahead(url, session):
+    client = Stash(url, 'admin', 'admin', session=session)
+    return len(client.get_commits('DEMO', 'repo', 'a' * 40, 'b' * 40, lookahead=4))
+
+
+def bamboo_plans(url, session):
+    client = Bamboo(url, 'admin', 'admin', session=session)
+    return len(list(client.plans(max_results=100, iterator=True)))
+
+
+SCENARIOS = [jira_jql_iter, jira_jql_iter_prefetch, jira_project_leaders, confluence_search_iter,
+             confluence_space_content_iter, stash_commits, stash_commits_lookahead, bamboo_plans]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))] if values else 0.0
+
+
+def timed(scenario, server_options):
+    """
+    Runs ``scenario`` once and returns the number of items it read, the number of requests it sent,
+    its duration and the latency of every response.
+    """
+    latencies = []
+
+    def record(response, *args, **kwargs):
+        latencies.append(response.elapsed.total_seconds())
+
+    # all clients of a scenario share this session, so its hook sees every response
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=10))
+    session.hooks['response'].append(record)
+    with session, FakeAtlassianServer(**server_options) as server:
+        started = time.perf_counter()
+        items = scenario(server.url, session)
+        elapsed = time.perf_counter() - started
+    return items, server.requests, elapsed, latencies
+
+
+def measure(scenario, options):
+    """
+    Returns the metrics of ``scenario``. Throughput and latency come from the fastest of ``repeat`` runs.
+    """
+    server_options = dict(items=options.items, page_size=options.page_size, payload_size=options.payload_size,
+                          latency=options.latency)
+    best = None
+    for _ in range(options.repeat):
+        run = timed(scenario, server_options)
+        if best is None or run[2] < best[2]:
+            best = run
+    items, count, elapsed, latencies = best
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    with requests.Session() as session, FakeAtlassianServer(**dict(server_options, latency=0.0)) as server:
+        tracemalloc.start()
+        scenario(server.url, session)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'items': items,
+        'requests': count,
+        'seconds': round(elapsed, 4),
+        'requests_per_second': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss, 1),
+        'allocated_mb': round(peak / 1024.0 / 1024.0, 2),
+    }
+
+
+def compare(name, result, baseline):
+    """
+    Returns the descriptions of the metrics of ``result`` that regressed against ``baseline``.
+    """
+    regressions = []
+    for metric, (tolerance, higher_is_better) in sorted(TOLERANCES.items()):
+        old, new = baseline.get(metric), result[metric]
+        if not old:
+            continue
+        change = (new - old) / float(old)
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append('{0}: {1} {2} -> {3} ({4:+.0%})'.format(name, metric, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run, all by default')
+    parser.add_argument('--items', type=int, default=10000, help='records served by every resource')
+    parser.add_argument('--page-size', type=int, default=100, help='largest page the server returns')
+    parser.add_argument('--payload-size', type=int, default=1024, help='bytes of payload in every record')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds the server waits per request')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per scenario, the fastest counts')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file, default: %(default)s')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    scenarios = {scenario.__name__: scenario for scenario in SCENARIOS}
+    names = options.scenarios or list(scenarios)
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        parser.error('unknown scenarios: {0}'.format(', '.join(unknown)))
+
+    if options.child:
+        print(json.dumps(measure(scenarios[names[0]], options)))
+        return 0
+
+    settings = {'items': options.items, 'page_size': options.page_size, 'payload_size': options.payload_size,
+                'latency': options.latency}
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+    if baseline and baseline.get('settings') != settings and not options.save_baseline:
+        print('Baseline was recorded with {0}, not comparing'.format(baseline.get('settings')))
+        baseline = {}
+
+    print('{0:32} {1:>6} {2:>9} {3:>8} {4:>8} {5:>8} {6:>9}'.format(
+        'scenario', 'reqs', 'req/s', 'p50 ms', 'p99 ms', 'RSS MB', 'alloc MB'))
+    results, regressions = {}, []
+    for name in names:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), name, '--child',
+                                          '--items', str(options.items), '--page-size', str(options.page_size),
+                                          '--payload-size', str(options.payload_size),
+                                          '--latency', str(options.latency), '--repeat', str(options.repeat)])
+        result = results[name] = json.loads(output.decode('utf-8').splitlines()[-1])
+        print('{0:32} {requests:>6} {requests_per_second:>9} {p50_ms:>8} {p99_ms:>8} {peak_rss_mb:>8} '
+              '{allocated_mb:>9}'.format(name, **result))
+        regressions.extend(compare(name, result, baseline.get('results', {}).get(name, {})))
+
+    if options.save_baseline:
+        if options.scenarios:
+            results = dict(baseline.get('results', {}), **results)
+        with open(options.baseline, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Saved baseline to {0}'.format(options.baseline))
+        return 0
+
+    for regression in regressions:
+        print('REGRESSION ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import logging
-from atlassian import Confluence
+import sys
 from atlassian import Jira
+from atlassian.utils import write_html_table
 
 
 logging.basicConfig(level=logging.DEBUG, format='[%(asctime).19s] [%(levelname)s] %(message)s')
@@ -13,12 +14,13 @@ jira = Jira(
     username='admin',
     password='admin')
 
-html = '<table><tr><th>Project Key</th><th>Project Name</th><th>Leader</th><th>Email</th></tr>'
 
-for data in jira.project_leaders():
-    log.info('{project_key} leader is {lead_name} <{lead_email}>'.format(**data))
-    html += '<tr><td>{project_key}</td><td>{project_name}<td></td>{lead_name}<td></td><a href="mailto:{lead_email}">{lead_email}</a></td></tr>'.format(**data)
+def project_leaders():
+    for data in jira.project_leaders():
+        log.info('{project_key} leader is {lead_name} <{lead_email}>'.format(**data))
+        yield data
 
-html += '</table><p></p><p></p>'
 
-print(html)
+# rows are written as the leaders are fetched, the table is never built in memory
+write_html_table(project_leaders(), ['project_key', 'project_name', 'lead_name', 'lead_email'], sys.stdout)
+print('<p></p><p></p>')
@@ -1,14 +1,19 @@
 from atlassian import Stash
+from atlassian.commitstore import CommitStore
 
 stash = Stash(
     url='http://localhost:7990',
     username='admin',
     password='admin')
 
-changelog = stash.get_changelog(
+# commits are kept between runs, so only new ones are downloaded
+store = CommitStore('commits.sqlite')
+
+changelog = stash.get_changelog_cached(
     project='DEMO',
     repository='example-repository',
     ref_from='develop',
-    ref_to='master')
+    ref_to='master',
+    store=store)
 
 print(changelog)